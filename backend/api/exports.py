@@ -0,0 +1,219 @@
+"""Выгрузка списка покупок в txt, csv и html для печати.
+
+Суммы берутся из ShoppingCartItem (см. recipes.shopping_cart), единицы
+приводятся в том же запросе. Строки читаются итератором (на PostgreSQL —
+серверным курсором) и отдаются StreamingHttpResponse по мере
+формирования. Готовый файл
+попутно собирается и кладётся в кэш с ключом по версии корзины, так что
+повторная выгрузка неизменившейся корзины отвечает 304 по ETag или
+телом из кэша, не обращаясь к базе данных.
+
+С EXPORT_ACCEL_REDIRECT файл выгрузки пишется в EXPORT_ROOT с именем по
+версии корзины, а отдаёт его nginx по X-Accel-Redirect: воркер gunicorn
+не ждёт медленного клиента.
+"""
+import csv
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Max, Min, Q, Sum, When
+from django.db.models.functions import Coalesce
+from django.http import (HttpResponse,
+                         HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.html import escape
+
+from api.reference import etag_matches
+from recipes.models import ShoppingCartItem
+from recipes.versions import CARTS, INGREDIENTS, get_versions, item
+
+KEY_PREFIX = 'shopping-cart-export'
+# Строк в одном отправляемом куске и в одной выборке из курсора.
+CHUNK_ROWS = 200
+# Файлы больше этого не кэшируются, а только отдаются потоком.
+CACHE_MAX_BYTES = 1024 * 1024
+CACHE_TIMEOUT = 60 * 60 * 24
+
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+HTML_HEAD = (
+    '<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8">'
+    '<title>Список покупок</title><style>'
+    'body{font-family:sans-serif;margin:2em}'
+    'table{border-collapse:collapse;width:100%}'
+    'td,th{border-bottom:1px solid #ccc;padding:.4em;text-align:left}'
+    'td.amount{text-align:right}'
+    'td.check{width:1.5em}'
+    '@media print{body{margin:0}}'
+    '</style></head><body onload="window.print()">'
+    '<h1>Список покупок</h1><table><thead><tr>'
+    '<th class="check"></th><th>Ингредиент</th><th>Количество</th>'
+    '</tr></thead><tbody>')
+HTML_ROW = (
+    '<tr><td class="check">&#9744;</td><td>{name}</td>'
+    '<td class="amount">{amount} {unit}</td></tr>')
+HTML_TAIL = '</tbody></table></body></html>'
+
+
+def shopping_cart_rows(user):
+    """(название, единица, сумма) по корзине user в алфавитном порядке.
+
+    Ингредиенты с одним названием группируются по базовой единице: если
+    единица у них одна, сумма остаётся в ней, иначе (г и кг, ч. л. и мл)
+    количества переводятся в базовую единицу и складываются в том же
+    запросе.
+    """
+    unit = 'ingredient__measurement_unit'
+    single_unit = Q(first_unit=F('last_unit'))
+    return ShoppingCartItem.objects.filter(
+        user=user
+    ).values(
+        'ingredient__name',
+        base_unit=Coalesce(f'{unit}__base', unit)
+    ).annotate(
+        first_unit=Min(unit),
+        last_unit=Max(unit)
+    ).annotate(
+        unit_name=Case(
+            When(single_unit, then=Min(f'{unit}__name')),
+            default=Min(f'{unit}__base__name')),
+        amount=Case(
+            When(single_unit, then=Sum('total_amount')),
+            default=Sum(F('total_amount') * F(f'{unit}__factor')))
+    ).order_by(
+        'ingredient__name',
+        'base_unit'
+    ).values_list(
+        'ingredient__name',
+        'unit_name',
+        'amount'
+    ).iterator(chunk_size=CHUNK_ROWS)
+
+
+def render_txt(rows):
+    separator = ''
+    for name, unit, amount in rows:
+        yield f'{separator}{name} ({unit}) — {amount}'
+        separator = '\n'
+
+
+class _Line:
+    """Файлоподобный объект: csv.writer возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Line())
+    # BOM, чтобы Excel открыл кириллицу в UTF-8 без мастера импорта.
+    yield '\ufeff' + writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_html(rows):
+    yield HTML_HEAD
+    for name, unit, amount in rows:
+        yield HTML_ROW.format(
+            name=escape(name), unit=escape(unit), amount=amount)
+    yield HTML_TAIL
+
+
+# Тип выгрузки -> (функция, content type, расширение, вложение ли).
+EXPORT_TYPES = {
+    'txt': (render_txt, 'text/plain; charset=utf-8', 'txt', True),
+    'csv': (render_csv, 'text/csv; charset=utf-8', 'csv', True),
+    'html': (render_html, 'text/html; charset=utf-8', 'html', False),
+}
+
+
+def export_shopping_cart(request, export_type):
+    """Ответ с выгрузкой корзины текущего пользователя."""
+    render, content_type, extension, attachment = EXPORT_TYPES[export_type]
+    user = request.user
+    versions = get_versions((item(CARTS, user.pk), INGREDIENTS))
+    etag = '"cart-{}-{}-{}-{}"'.format(
+        user.pk,
+        versions[item(CARTS, user.pk)],
+        versions[INGREDIENTS],
+        export_type)
+    key = f'{KEY_PREFIX}:{etag[1:-1]}'
+    if etag_matches(request, (etag,)):
+        response = HttpResponseNotModified()
+    else:
+        body = None if settings.EXPORT_ACCEL_REDIRECT else cache.get(key)
+        if settings.EXPORT_ACCEL_REDIRECT:
+            # Тело пустое: nginx отдаёт файл, сохраняя заголовки ответа.
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Accel-Redirect'] = _export_file(
+                user,
+                f'{versions[item(CARTS, user.pk)]}-{versions[INGREDIENTS]}',
+                render, extension)
+        elif body is not None:
+            response = HttpResponse(body, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                _cached_stream(render(shopping_cart_rows(user)), key),
+                content_type=content_type)
+        disposition = 'attachment' if attachment else 'inline'
+        response.headers['Content-Disposition'] = (
+            f'{disposition}; filename="shopping_list.{extension}"')
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def _chunks(parts):
+    """Склеивает parts в байтовые куски по CHUNK_ROWS."""
+    chunk = []
+    for part in parts:
+        chunk.append(part)
+        if len(chunk) >= CHUNK_ROWS:
+            yield ''.join(chunk).encode()
+            chunk = []
+    yield ''.join(chunk).encode()
+
+
+def _cached_stream(parts, key):
+    """Отдаёт parts кусками по CHUNK_ROWS и кэширует весь файл."""
+    body = []
+    size = 0
+    for data in _chunks(parts):
+        size += len(data)
+        if size <= CACHE_MAX_BYTES:
+            body.append(data)
+        yield data
+    if size <= CACHE_MAX_BYTES:
+        cache.set(key, b''.join(body), timeout=CACHE_TIMEOUT)
+
+
+def _export_file(user, tag, render, extension):
+    """Адрес для X-Accel-Redirect; файл пишется, если его ещё нет.
+
+    tag — версии корзины и справочника, по ним меняется имя файла.
+    """
+    directory = os.path.join(settings.EXPORT_ROOT, str(user.pk))
+    name = f'{tag}.{extension}'
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # Недописанный файл не виден nginx: он появляется переименованием.
+        with tempfile.NamedTemporaryFile(
+            'wb', dir=directory, prefix='.', delete=False
+        ) as file:
+            for data in _chunks(render(shopping_cart_rows(user))):
+                file.write(data)
+        os.replace(file.name, path)
+        # Выгрузки прежних версий корзины больше не запросят.
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.startswith(('.', f'{tag}.')):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+    return f'{settings.EXPORT_ACCEL_URL}{user.pk}/{name}'
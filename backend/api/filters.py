@@ -1,7 +1,9 @@
 import django_filters
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import CharFilter, FilterSet
 
-from recipes.models import Recipe, Ingredient
+from recipes.fulltext import search_recipes
+from recipes.models import Ingredient, Recipe, Tag
 
 
 class IngredientFilter(FilterSet):
@@ -16,17 +18,32 @@ class IngredientFilter(FilterSet):
 class RecipeFilter(FilterSet):
     """Фильтр для рецептов."""
 
-    tags = django_filters.AllValuesMultipleFilter(
-        field_name='tags__slug', lookup_expr='icontains')
+    # Варианты берутся из таблицы тегов, а не перебором всех рецептов.
+    tags = django_filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+        method='get_tags')
 
     is_in_shopping_cart = django_filters.NumberFilter(
         method='get_is_in_shopping_cart')
 
     is_favorited = django_filters.NumberFilter(method='get_is_in_favorite')
 
+    search = CharFilter(method='get_search')
+
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_in_shopping_cart', 'is_favorited']
+        fields = [
+            'tags', 'author', 'is_in_shopping_cart', 'is_favorited', 'search']
+
+    def get_tags(self, queryset, name, value):
+        # EXISTS вместо JOIN с DISTINCT: страница по -id читается по
+        # первичному ключу и останавливается на нужном числе строк.
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=value)))
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -37,3 +54,6 @@ class RecipeFilter(FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(favorite__user=self.request.user)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
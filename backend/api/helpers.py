@@ -1,16 +1,113 @@
 import base64
+import binascii
+import os
+import tempfile
+import weakref
+from contextlib import suppress
 
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
 from rest_framework import serializers
 
+from recipes import renditions
+
+# Сигнатуры PNG, JPEG и GIF; WebP проверяется отдельно (RIFF....WEBP).
+IMAGE_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a')
+IMAGE_HEADER_SIZE = 12
+# Кусок base64, декодируемый за раз; кратен 4.
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+def is_image_header(header):
+    """Похожи ли первые байты файла на PNG, JPEG, GIF или WebP."""
+    return header.startswith(IMAGE_SIGNATURES) or (
+        header[:4] == b'RIFF' and header[8:12] == b'WEBP')
+
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка строкой data:image/...;base64 или файлом multipart.
+
+    Заголовок проверяется до разбора картинки Pillow. Большие картинки
+    из base64 декодируются кусками во временный файл, как и файлы из
+    multipart (FILE_UPLOAD_MAX_MEMORY_SIZE).
+    """
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, 'temp.' + ext)
+        elif hasattr(data, 'read'):
+            data.seek(0)
+            header = data.read(IMAGE_HEADER_SIZE)
+            data.seek(0)
+            if not is_image_header(header):
+                self.fail('invalid_image')
 
         return super().to_internal_value(data)
+
+    def decode(self, imgstr, name):
+        try:
+            header = base64.b64decode(
+                imgstr[:IMAGE_HEADER_SIZE // 3 * 4], validate=True)
+        except binascii.Error:
+            self.fail('invalid_image')
+        if not is_image_header(header):
+            self.fail('invalid_image')
+        if len(imgstr) // 4 * 3 <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            try:
+                return ContentFile(base64.b64decode(imgstr), name=name)
+            except binascii.Error:
+                self.fail('invalid_image')
+        file = SpooledImageFile(name)
+        try:
+            for start in range(0, len(imgstr), BASE64_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    imgstr[start:start + BASE64_CHUNK_SIZE], validate=True))
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_image')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+
+class SpooledImageFile(UploadedFile):
+    """Картинка из base64 во временном файле на диске.
+
+    Хранилище забирает файл переносом (temporary_file_path); если
+    картинка так и не сохранена, файл удаляется вместе с объектом.
+    """
+
+    def __init__(self, name):
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR,
+            delete=False)
+        super().__init__(file, name, None, 0, None)
+        weakref.finalize(self, _remove, file.name)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _remove(path):
+    with suppress(FileNotFoundError):
+        os.remove(path)
+
+
+class RenditionsField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки {размер: {формат: ссылка}}.
+
+    Пока копии собираются, поле пустое — клиент берёт исходную картинку.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        return renditions.urls(
+            instance, self.image_field, self.context.get('request'))
@@ -0,0 +1,57 @@
+from django.utils.functional import cached_property
+
+
+class UserRelationsLoader:
+    """Связи текущего пользователя, загружаемые один раз за запрос.
+
+    Каждое множество id читается одним запросом при первом обращении,
+    дальше все проверки флагов отвечаются из памяти.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @classmethod
+    def for_request(cls, request):
+        """Возвращает загрузчик, общий для всего запроса."""
+        if request is None:
+            return cls(None)
+        loader = getattr(request, '_relations_loader', None)
+        if loader is None:
+            loader = cls(request.user)
+            request._relations_loader = loader
+        return loader
+
+    @property
+    def is_authenticated(self):
+        return self.user is not None and self.user.is_authenticated
+
+    @cached_property
+    def subscribed_author_ids(self):
+        if not self.is_authenticated:
+            return frozenset()
+        return frozenset(
+            self.user.subscriber.values_list('author_id', flat=True))
+
+    @cached_property
+    def favorite_recipe_ids(self):
+        if not self.is_authenticated:
+            return frozenset()
+        return frozenset(
+            self.user.favorite.values_list('recipe_id', flat=True))
+
+    @cached_property
+    def shopping_cart_recipe_ids(self):
+        if not self.is_authenticated:
+            return frozenset()
+        return frozenset(
+            self.user.shopping_list.values_list('recipe_id', flat=True))
+
+    def is_subscribed(self, author):
+        return author.pk in self.subscribed_author_ids
+
+    def is_favorited(self, recipe):
+        return recipe.pk in self.favorite_recipe_ids
+
+    def is_in_shopping_cart(self, recipe):
+        return recipe.pk in self.shopping_cart_recipe_ids
@@ -0,0 +1,176 @@
+import json
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Замер задержек и пропускной способности эндпоинтов API."""
+
+    help = (
+        'Прогоняет запросы к основным эндпоинтам через тестовый клиент '
+        'Django (по умолчанию) или к запущенному серверу (--base-url) и '
+        'выводит p50/p95/p99 и RPS по каждому эндпоинту в формате JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Число параллельных клиентов, только с --base-url.')
+        parser.add_argument(
+            '--base-url',
+            help='Адрес запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument(
+            '--user',
+            help='email пользователя, от имени которого идут запросы.')
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Имя эндпоинта из списка; можно повторять.')
+        parser.add_argument('--output', help='Файл для JSON-отчёта.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('Для перцентилей нужно хотя бы 2 запроса.')
+        user = self.get_user(options['user'])
+        token = Token.objects.get_or_create(user=user)[0].key
+        endpoints = self.get_endpoints(user)
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - set(endpoints)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}.')
+            endpoints = {
+                name: endpoints[name] for name in options['endpoints']}
+        if options['base_url']:
+            send = _live_sender(options['base_url'].rstrip('/'), token)
+        else:
+            send = _client_sender(token)
+
+        report = {
+            'commit': _current_commit(),
+            'mode': options['base_url'] or 'test-client',
+            'database': settings.DATABASES['default']['ENGINE'],
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'endpoints': {},
+        }
+        for name, path in endpoints.items():
+            for _ in range(options['warmup']):
+                send(path)
+            report['endpoints'][name] = _measure(
+                send, path, options['requests'], options['concurrency'])
+            self.stderr.write(f'{name}: {report["endpoints"][name]}')
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                subscriptions=Count('subscriber')
+            ).order_by('-subscriptions').first()
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден, сначала выполните generate_dataset.')
+        return user
+
+    def get_endpoints(self, user):
+        recipe = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first()
+        tag = Tag.objects.values_list('slug', flat=True).first()
+        ingredient = Ingredient.objects.values_list('name', flat=True).first()
+        if recipe is None or ingredient is None:
+            raise CommandError(
+                'В базе нет рецептов или ингредиентов, сначала выполните '
+                'generate_dataset.')
+        return {
+            'recipes': '/api/recipes/',
+            'recipes_deep_page': '/api/recipes/?page=50',
+            'recipes_tag': f'/api/recipes/?tags={tag}',
+            'recipes_favorited': '/api/recipes/?is_favorited=1',
+            'recipes_author': f'/api/recipes/?author={user.pk}',
+            'recipe_detail': f'/api/recipes/{recipe}/',
+            'users': '/api/users/',
+            'me': '/api/users/me/',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'tags': '/api/tags/',
+            'ingredients': '/api/ingredients/',
+            'ingredients_search': (
+                f'/api/ingredients/?name={ingredient[:2]}'),
+            'shopping_cart_download': '/api/recipes/download_shopping_cart/',
+        }
+
+
+def _measure(send, path, requests, concurrency):
+    def timed(_):
+        started = time.perf_counter()
+        status_code = send(path)
+        return time.perf_counter() - started, status_code
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, range(requests)))
+    else:
+        results = [timed(number) for number in range(requests)]
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'rps': round(requests / elapsed, 1),
+        'errors': sum(1 for _, code in results if code >= 400),
+    }
+
+
+def _client_sender(token):
+    client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0].strip())
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def send(path):
+        return client.get(path).status_code
+    return send
+
+
+def _live_sender(base_url, token):
+    def send(path):
+        request = Request(
+            base_url + path, headers={'Authorization': f'Token {token}'})
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            return error.code
+    return send
+
+
+def _current_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
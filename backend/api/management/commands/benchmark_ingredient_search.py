@@ -0,0 +1,113 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api.search import ingredient_index, normalize
+from api.serializers import IngredientSerializer
+from recipes.constants import INGREDIENT_SEARCH_LIMIT
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS, get_version
+
+
+class Command(BaseCommand):
+    """Сравнение поиска ингредиентов в индексе и через istartswith."""
+
+    help = (
+        'Замеряет время ответа на запросы автодополнения: фильтр '
+        'name__istartswith с сериализацией, префиксный и нечёткий поиск '
+        'по индексу в памяти. Поиск по индексу замеряется отдельно от '
+        'чтения версии справочника, которое добавляется к каждому '
+        'запросу. Для запросов с опечаткой считает долю, в которой '
+        'нужный ингредиент попал в выдачу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Справочник пуст, выполните load_db.')
+        rng = random.Random(options['seed'])
+        prefixes = []
+        typos = []
+        for name in rng.choices(names, k=options['queries']):
+            word = name.split()[0]
+            prefixes.append(word[:rng.randint(2, max(2, len(word)))])
+            if len(word) >= 4:
+                typos.append((_misspell(word, rng), word))
+        version = get_version(INGREDIENTS)
+        ingredient_index.render(version=version)
+
+        def index_search(query, fuzzy=False):
+            return ingredient_index.render(
+                query, INGREDIENT_SEARCH_LIMIT, fuzzy=fuzzy, version=version)
+
+        report = {
+            'catalog_size': len(names),
+            'version_check': _timings(
+                lambda query: get_version(INGREDIENTS), prefixes),
+            'prefix': {
+                'istartswith_db': _timings(_database_search, prefixes),
+                'index_prefix': _timings(index_search, prefixes),
+                'index_fuzzy': _timings(
+                    lambda query: index_search(query, fuzzy=True), prefixes),
+            },
+            'typo': {
+                'istartswith_db': _timings(
+                    _database_search, [typo for typo, _ in typos]),
+                'index_fuzzy': _timings(
+                    lambda query: index_search(query, fuzzy=True),
+                    [typo for typo, _ in typos]),
+                'istartswith_recall': _recall(_database_search, typos),
+                'fuzzy_recall': _recall(
+                    lambda query: index_search(query, fuzzy=True), typos),
+            },
+        }
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def _database_search(query):
+    return JSONRenderer().render(IngredientSerializer(
+        Ingredient.objects.filter(name__istartswith=query), many=True).data)
+
+
+def _timings(search, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - started) * 1_000_000)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'p50_us': round(cuts[49], 1),
+        'p95_us': round(cuts[94], 1),
+        'p99_us': round(cuts[98], 1),
+    }
+
+
+def _recall(search, typos):
+    found = sum(
+        1 for typo, word in typos
+        if any(normalize(item['name']).startswith(normalize(word))
+               for item in json.loads(search(typo))))
+    return round(found / len(typos), 3)
+
+
+def _misspell(word, rng):
+    """Одна случайная правка: замена, пропуск, вставка или перестановка."""
+    position = rng.randrange(1, len(word) - 1)
+    letter = rng.choice('абвгдеклмнопрстуя')
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:position] + letter + word[position + 1:]
+    if kind == 1:
+        return word[:position] + word[position + 1:]
+    if kind == 2:
+        return word[:position] + letter + word[position:]
+    return (word[:position] + word[position + 1] + word[position]
+            + word[position + 2:])
@@ -0,0 +1,78 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from recipes.fulltext import search_recipes
+from recipes.models import Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    """Сравнение полнотекстового поиска рецептов с ILIKE-сканом."""
+
+    help = (
+        'Замеряет первую страницу и подсчёт результатов поиска рецептов '
+        'через индекс (tsvector/FTS5) и через icontains по названию, '
+        'описанию и ингредиентам. Для осмысленных цифр наполните базу '
+        'командой generate_dataset, например на 100 000 рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument(
+            '--skip-ilike', action='store_true',
+            help='Не замерять ILIKE-скан, он долгий на больших данных.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        total = Recipe.objects.count()
+        words = [
+            word for name in Ingredient.objects.values_list('name', flat=True)
+            for word in name.split() if len(word) > 3]
+        if not total or not words:
+            raise CommandError('Нет рецептов, выполните generate_dataset.')
+        rng = random.Random(options['seed'])
+        queries = rng.choices(words, k=options['queries'])
+        page_size = options['page_size']
+
+        def indexed(query):
+            recipes = search_recipes(Recipe.objects.all(), query)
+            return list(recipes[:page_size]), recipes.count()
+
+        def ilike(query):
+            recipes = Recipe.objects.filter(
+                Q(name__icontains=query)
+                | Q(text__icontains=query)
+                | Q(ingredients__name__icontains=query)).distinct()
+            return list(recipes[:page_size]), recipes.count()
+
+        report = {
+            'database': connection.vendor,
+            'recipes': total,
+            'queries': len(queries),
+            'index': _timings(indexed, queries),
+        }
+        if not options['skip_ilike']:
+            report['ilike'] = _timings(ilike, queries)
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def _timings(search, queries):
+    latencies = []
+    matches = []
+    for query in queries:
+        started = time.perf_counter()
+        _, count = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        matches.append(count)
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'p50_ms': round(cuts[49], 2),
+        'p95_ms': round(cuts[94], 2),
+        'p99_ms': round(cuts[98], 2),
+        'mean_matches': round(statistics.fmean(matches), 1),
+    }
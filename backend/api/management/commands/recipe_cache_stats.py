@@ -0,0 +1,40 @@
+import json
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from api.representations import recipe_representations
+
+# У этих кэшей счётчики свои в каждом процессе, а у команды — всегда нули.
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+class Command(BaseCommand):
+    """Попадания и промахи кэша представлений рецептов."""
+
+    help = (
+        'Выводит счётчики попаданий и промахов кэша представлений '
+        'рецептов по всем процессам и их долю. С --reset обнуляет их, '
+        'чтобы замерить работу после изменения размера кэша. Нужен общий '
+        'кэш (REDIS_URL): из LocMemCache воркеров счётчики не прочитать.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true')
+
+    def handle(self, *args, **options):
+        backend = caches['default']
+        if isinstance(backend, PROCESS_LOCAL_CACHES):
+            raise CommandError(
+                f'Кэш {type(backend).__name__} не общий для процессов: '
+                'счётчики воркеров не видны команде. Задайте REDIS_URL.')
+        hits, misses = recipe_representations.stats()
+        total = hits + misses
+        self.stdout.write(json.dumps({
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else None,
+        }, indent=2))
+        if options['reset']:
+            recipe_representations.reset_stats()
@@ -1,6 +1,151 @@
-from rest_framework.pagination import PageNumberPagination
+from hashlib import blake2b
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+# Начиная с этого числа строк общее количество может быть приблизительным.
+APPROXIMATE_COUNT_THRESHOLD = 10_000
+# Сколько секунд точный подсчёт большой выборки используется повторно.
+COUNT_CACHE_TIMEOUT = 60
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator, который не пересчитывает большие выборки каждый раз.
+
+    Для выборок не меньше APPROXIMATE_COUNT_THRESHOLD строк количество
+    берётся из оценки планировщика PostgreSQL или из точного подсчёта,
+    закэшированного на COUNT_CACHE_TIMEOUT секунд. Маленькие и сильно
+    отфильтрованные выборки считаются точно: оценка для них мала, а
+    COUNT(*) дёшев. Признак приблизительности — атрибут approximate.
+
+    Пока в кэше лежит прошлый подсчёт, план запроса не запрашивается:
+    маленькая выборка сразу считается точно, большая берётся из кэша.
+    Если оценка завышена и страница вернулась неполной, количество
+    уточняется и кэшируется вместо оценки.
+    """
+
+    approximate = False
+
+    @cached_property
+    def count_queryset(self):
+        # Аннотации для конкретного зрителя на количество не влияют, если
+        # по ним не фильтруют: ключ кэша у анонима и пользователя общий.
+        return self.object_list.order_by().values('pk')
+
+    @cached_property
+    def count_key(self):
+        return 'paginator-count:' + blake2b(
+            str(self.count_queryset.query).encode(),
+            digest_size=16).hexdigest()
+
+    @cached_property
+    def count(self):
+        queryset = self.count_queryset
+        cached = cache.get(self.count_key)
+        if cached is not None and cached >= APPROXIMATE_COUNT_THRESHOLD:
+            self.approximate = True
+            return cached
+        if cached is None:
+            estimate = _planner_estimate(queryset)
+            if (estimate is not None
+                    and estimate >= APPROXIMATE_COUNT_THRESHOLD):
+                self.approximate = True
+                cache.set(
+                    self.count_key, estimate, timeout=COUNT_CACHE_TIMEOUT)
+                return estimate
+        count = queryset.count()
+        cache.set(self.count_key, count, timeout=COUNT_CACHE_TIMEOUT)
+        return count
+
+    def page(self, number):
+        page = super().page(number)
+        if not self.approximate:
+            return page
+        page.object_list = list(page.object_list)
+        if len(page.object_list) < self.per_page:
+            # Неполная страница — значит, выборка меньше оценки.
+            bottom = (page.number - 1) * self.per_page
+            self._set_exact_count(
+                bottom + len(page.object_list) if page.object_list
+                else self.count_queryset.count())
+            self.validate_number(number)
+        return page
+
+    def _set_exact_count(self, count):
+        self.approximate = False
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+        cache.set(self.count_key, count, timeout=COUNT_CACHE_TIMEOUT)
+
+
+class KeysetPagination(CursorPagination):
+    """Постраничный вывод по ключу сортировки, без COUNT(*) и OFFSET."""
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
 
 
 class CustomPagination(PageNumberPagination):
+    """Номера страниц по умолчанию, курсор — по параметру cursor.
+
+    В режиме номеров страниц поле count_approximate сообщает, что count
+    большой выборки оценён, а не посчитан (см. ApproximateCountPaginator).
+
+    Запрос с ?cursor= (пустым для первой страницы) переключает список
+    на KeysetPagination: ответ содержит next и previous без count, а
+    любая страница стоит столько же, сколько первая. Ключ сортировки
+    задаёт атрибут cursor_ordering представления.
+    """
+
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    django_paginator_class = ApproximateCountPaginator
+
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = KeysetPagination()
+        self.keyset.ordering = getattr(
+            view, 'cursor_ordering', KeysetPagination.ordering)
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return Response({
+            'count': self.page.paginator.count,
+            'count_approximate': self.page.paginator.approximate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response_schema(schema)
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_approximate'] = {
+            'type': 'boolean',
+            'example': False,
+        }
+        return response_schema
+
+
+def _planner_estimate(queryset):
+    """Оценка числа строк по плану запроса; None, если её нет."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return plan[0]['Plan']['Plan Rows']
@@ -11,4 +11,6 @@ class IsAdmin(BasePermission):
 class IsAuthorOrReadOnly(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return obj.author == request.user or request.method in SAFE_METHODS
+        return (
+            request.method in SAFE_METHODS
+            or obj.author_id == request.user.id)
@@ -0,0 +1,111 @@
+"""Готовые ответы справочников с ETag и gzip.
+
+Тела ответов хранятся в памяти процесса вместе со сжатой копией и
+сбрасываются при смене версии справочника. ETag вычисляется из версии
+и параметров запроса, поэтому на If-None-Match с актуальным значением
+отвечаем 304, не обращаясь к базе данных и сериализаторам.
+"""
+import gzip
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from recipes.versions import get_version
+
+# Тела короче этого не сжимаются: выигрыш меньше заголовков gzip.
+GZIP_MIN_LENGTH = 200
+# Сколько разных ответов одного справочника держать в памяти.
+MAX_ENTRIES = 1024
+
+
+class ReferenceResponses:
+    """Ответы справочника catalog, подготовленные для текущей версии.
+
+    render(version, *key) возвращает JSON-тело в байтах. Версия читается
+    до вызова render и передаётся ему, так что тело никогда не старше
+    своего ETag, а повторно её не читают.
+    """
+
+    def __init__(self, catalog, render):
+        self.catalog = catalog
+        self.render = render
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def respond(self, request, *key):
+        version = get_version(self.catalog)
+        use_gzip = _accepts_gzip(request)
+        tag = _etag(self.catalog, version, key)
+        if etag_matches(request, (tag, _gzip_etag(tag))):
+            response = HttpResponseNotModified()
+            response.headers['ETag'] = _gzip_etag(tag) if use_gzip else tag
+        else:
+            body, compressed = self._get(version, key)
+            if use_gzip and compressed is not None:
+                response = HttpResponse(
+                    compressed, content_type='application/json')
+                response.headers['Content-Encoding'] = 'gzip'
+                response.headers['ETag'] = _gzip_etag(tag)
+            else:
+                response = HttpResponse(body, content_type='application/json')
+                response.headers['ETag'] = tag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def _get(self, version, key):
+        with self._lock:
+            if self._version != version:
+                self._version = version
+                self._entries.clear()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        body = self.render(version, *key)
+        compressed = None
+        if len(body) >= GZIP_MIN_LENGTH:
+            compressed = gzip.compress(body, mtime=0)
+            if len(compressed) >= len(body):
+                compressed = None
+        with self._lock:
+            if self._version == version:
+                self._entries[key] = body, compressed
+                if len(self._entries) > MAX_ENTRIES:
+                    self._entries.popitem(last=False)
+        return body, compressed
+
+
+def _etag(catalog, version, key):
+    digest = blake2b(repr(key).encode(), digest_size=8).hexdigest()
+    return f'"{catalog}-{version}-{digest}"'
+
+
+def _gzip_etag(tag):
+    """Сжатое тело — другое представление, ему нужен свой сильный ETag."""
+    return f'{tag[:-1]}-gzip"'
+
+
+def _accepts_gzip(request):
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip() == 'gzip':
+            return params.replace(' ', '') not in ('q=0', 'q=0.0')
+    return False
+
+
+def etag_matches(request, tags):
+    """Совпадает ли If-None-Match запроса с одним из ETag из tags."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    received = parse_etags(header)
+    if '*' in received:
+        return True
+    return any(
+        received_tag.removeprefix('W/') in tags for received_tag in received)
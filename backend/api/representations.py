@@ -0,0 +1,119 @@
+"""Кэш представлений рецептов, общих для всех пользователей.
+
+В кэше Django лежит результат RecipeReadSerializer для анонимного
+пользователя с относительными ссылками на картинки. Ключ включает
+версии рецепта, его автора и справочников тегов и ингредиентов, поэтому
+изменение любого из них делает запись недоступной без явного удаления.
+Флаги избранного, корзины и подписки на автора берутся из аннотаций
+with_user_flags и накладываются на копию при ответе.
+"""
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+
+from api.serializers import RecipeReadSerializer
+from recipes.models import Recipe
+from recipes.versions import (INGREDIENTS,
+                              RECIPES,
+                              TAGS,
+                              USERS,
+                              get_versions,
+                              item)
+
+KEY_PREFIX = 'recipe-representation'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+# Формат копии картинки, на которую ссылается image в списках.
+IMAGE_FORMAT = 'webp'
+# Записи устаревших версий вытесняются по этому сроку или по LRU Redis.
+TIMEOUT = 60 * 60 * 24
+
+
+class RecipeRepresentationCache:
+    """Представления рецептов из кэша с наложением флагов зрителя.
+
+    recipes — рецепты с аннотациями with_user_flags и счётчиками
+    favorites_count и shopping_carts_count; остальные поля не нужны, при
+    промахе рецепты перечитываются с with_related. С image_size поле
+    image ссылается на копию этого размера, если она уже собрана.
+    """
+
+    def render(self, recipes, request, image_size=None):
+        if not recipes:
+            return []
+        versions = get_versions(
+            [TAGS, INGREDIENTS]
+            + [item(RECIPES, recipe.pk) for recipe in recipes]
+            + [item(USERS, recipe.author_id) for recipe in recipes])
+        keys = {
+            recipe.pk: ':'.join((
+                KEY_PREFIX,
+                str(recipe.pk),
+                versions[item(RECIPES, recipe.pk)],
+                versions[item(USERS, recipe.author_id)],
+                versions[TAGS],
+                versions[INGREDIENTS]))
+            for recipe in recipes}
+        cached = cache.get_many(keys.values())
+        missing = [pk for pk, key in keys.items() if key not in cached]
+        if missing:
+            fresh = {
+                keys[data['id']]: data
+                for data in RecipeReadSerializer(
+                    Recipe.objects.with_related().with_user_flags(
+                        AnonymousUser()).filter(pk__in=missing),
+                    many=True).data}
+            cache.set_many(fresh, timeout=TIMEOUT)
+            cached.update(fresh)
+        _count(HITS_KEY, len(keys) - len(missing))
+        _count(MISSES_KEY, len(missing))
+        return [
+            _overlay(cached[keys[recipe.pk]], recipe, request, image_size)
+            for recipe in recipes if keys[recipe.pk] in cached]
+
+    def stats(self):
+        counters = cache.get_many((HITS_KEY, MISSES_KEY))
+        return counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
+
+    def reset_stats(self):
+        cache.delete_many((HITS_KEY, MISSES_KEY))
+
+
+def _overlay(data, recipe, request, image_size):
+    data = dict(data)
+    author = data['author'] = dict(data['author'])
+    data['is_favorited'] = recipe.is_favorited
+    data['is_in_shopping_cart'] = recipe.is_in_shopping_cart
+    data['favorites_count'] = recipe.favorites_count
+    data['shopping_carts_count'] = recipe.shopping_carts_count
+    author['is_subscribed'] = recipe.is_subscribed_to_author
+    renditions = data['image_renditions'] = _absolute_renditions(
+        data['image_renditions'], request)
+    author['avatar_renditions'] = _absolute_renditions(
+        author['avatar_renditions'], request)
+    if image_size in renditions:
+        data['image'] = renditions[image_size][IMAGE_FORMAT]
+    elif data['image']:
+        data['image'] = request.build_absolute_uri(data['image'])
+    if author['avatar']:
+        author['avatar'] = request.build_absolute_uri(author['avatar'])
+    return data
+
+
+def _absolute_renditions(renditions, request):
+    return {
+        size: {
+            name: request.build_absolute_uri(url)
+            for name, url in formats.items()}
+        for size, formats in renditions.items()}
+
+
+def _count(key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, delta, timeout=None)
+
+
+recipe_representations = RecipeRepresentationCache()
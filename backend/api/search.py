@@ -0,0 +1,259 @@
+import heapq
+import json
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from typing import NamedTuple
+
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS, get_version
+
+# Символ, больший любого другого: граница диапазона строк с префиксом.
+MAX_CHAR = chr(0x10FFFF)
+# Нечёткий поиск включается для запросов не короче этой длины.
+FUZZY_MIN_LENGTH = 3
+# Для префиксов слов длиннее этого опечатки не индексируются: кандидаты
+# для длинного запроса ищутся по его началу такой длины.
+FUZZY_MAX_PREFIX = 12
+# Наибольшее расстояние Дамерау — Левенштейна до начала слова.
+FUZZY_MAX_DISTANCE = 2
+# Сколько слов-кандидатов сверять с запросом: у коротких запросов их
+# сотни, а расстояние считается по одному слову за раз.
+FUZZY_MAX_CANDIDATES = 64
+
+
+class _Snapshot(NamedTuple):
+    version: str
+    keys: list
+    bodies: list
+    words: list
+    word_entries: list
+    trigrams: dict
+    deletions: dict
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся нормализованными и отсортированными, поиск по
+    префиксу — двоичный. Для нечёткого поиска по уникальным словам
+    названий строятся инвертированный индекс символьных триграмм (поиск
+    вхождений) и индекс удалений одного символа из префиксов слов (поиск
+    опечаток без перебора словаря). Для каждой строки заранее
+    сериализован JSON-объект, так что ответ собирается склейкой байтов.
+    Индекс перестраивается при смене версии справочника ингредиентов;
+    версию можно передать, если она уже прочитана.
+    """
+
+    def __init__(self):
+        self._snapshot = _Snapshot(None, [], [], [], [], {}, {})
+        self._lock = Lock()
+
+    def _load(self, version=None):
+        if version is None:
+            version = get_version(INGREDIENTS)
+        if self._snapshot.version != version:
+            with self._lock:
+                if self._snapshot.version != version:
+                    self._snapshot = self._build(version)
+        return self._snapshot
+
+    def _build(self, version):
+        entries = sorted(
+            (normalize(name), pk, _dump(
+                {'id': pk, 'name': name, 'measurement_unit': unit}))
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit__name'))
+        keys = [key for key, _, _ in entries]
+        word_ids = {}
+        word_entries = []
+        for position, key in enumerate(keys):
+            for order, word in enumerate(key.split()):
+                if word not in word_ids:
+                    word_ids[word] = len(word_entries)
+                    word_entries.append([])
+                word_entries[word_ids[word]].append((position, order > 0))
+        trigrams = defaultdict(set)
+        deletions = defaultdict(set)
+        for word, word_id in word_ids.items():
+            for trigram in _trigrams(word):
+                trigrams[trigram].add(word_id)
+            for length in range(
+                    FUZZY_MIN_LENGTH - 1,
+                    min(len(word), FUZZY_MAX_PREFIX) + 1):
+                for variant in _deletions(word[:length]):
+                    deletions[variant].add(word_id)
+        return _Snapshot(
+            version,
+            keys,
+            [body for _, _, body in entries],
+            list(word_ids),
+            word_entries,
+            {trigram: tuple(ids) for trigram, ids in trigrams.items()},
+            {variant: tuple(sorted(ids))
+             for variant, ids in deletions.items()})
+
+    def prefix_positions(self, snapshot, query, limit=None):
+        start = bisect_left(snapshot.keys, query)
+        end = bisect_left(snapshot.keys, query + MAX_CHAR, lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return range(start, end)
+
+    def contains_positions(self, snapshot, query):
+        """Названия, в словах которых query встречается не с начала."""
+        if ' ' in query:
+            return {
+                position for position, key in enumerate(snapshot.keys)
+                if query in key}
+        query_trigrams = _trigrams(query)
+        candidates = set.intersection(*(
+            set(snapshot.trigrams.get(trigram, ()))
+            for trigram in query_trigrams))
+        return {
+            position
+            for word_id in candidates if query in snapshot.words[word_id]
+            for position, _ in snapshot.word_entries[word_id]}
+
+    def typo_positions(self, snapshot, query, limit):
+        """Названия со словом, начало которого отличается на одну-две правки.
+
+        Кандидаты — слова, совпадающие с запросом с точностью до удаления
+        не больше одного символа с каждой стороны: так находятся замена,
+        вставка, пропуск и перестановка соседних букв. Запрос длиннее
+        FUZZY_MAX_PREFIX ищется по началу, остаток сверяет расстояние.
+        Сверяется не больше FUZZY_MAX_CANDIDATES слов, сначала найденные
+        по самому запросу. Возвращаются limit ближайших по расстоянию
+        Дамерау — Левенштейна.
+        """
+        query_prefix = query[:FUZZY_MAX_PREFIX]
+        variants = sorted(_deletions(query_prefix) - {query_prefix})
+        word_ids = {}
+        for variant in [query_prefix, *variants]:
+            for word_id in snapshot.deletions.get(variant, ()):
+                word_ids.setdefault(word_id, None)
+            if len(word_ids) >= FUZZY_MAX_CANDIDATES:
+                break
+        ranks = {}
+        for word_id in list(word_ids)[:FUZZY_MAX_CANDIDATES]:
+            word = snapshot.words[word_id]
+            distance = _prefix_distance(query, word)
+            if distance > FUZZY_MAX_DISTANCE:
+                continue
+            for position, not_first in snapshot.word_entries[word_id]:
+                rank = (distance, not_first, len(word), position)
+                if position not in ranks or rank < ranks[position]:
+                    ranks[position] = rank
+        return [rank[-1] for rank in heapq.nsmallest(limit, ranks.values())]
+
+    def fuzzy_positions(self, snapshot, query, limit):
+        """Префиксные совпадения, затем вхождения, затем опечатки."""
+        found = list(self.prefix_positions(snapshot, query, limit))
+        if len(found) >= limit or len(query) < FUZZY_MIN_LENGTH:
+            return found
+        seen = set(found)
+        contains = sorted(self.contains_positions(snapshot, query) - seen)
+        found.extend(contains[:limit - len(found)])
+        seen.update(contains)
+        if ' ' in query:
+            return found
+        # Среди limit ближайших могут быть уже найденные, но их меньше limit.
+        for position in self.typo_positions(snapshot, query, limit):
+            if len(found) >= limit:
+                break
+            if position not in seen:
+                seen.add(position)
+                found.append(position)
+        return found
+
+    def render(self, query='', limit=None, fuzzy=False, version=None):
+        """JSON-массив ингредиентов, подходящих под query."""
+        snapshot = self._load(version)
+        query = normalize(query)
+        if fuzzy and limit is not None:
+            positions = self.fuzzy_positions(snapshot, query, limit)
+        else:
+            positions = self.prefix_positions(snapshot, query, limit)
+        bodies = snapshot.bodies
+        return b'[' + b','.join(bodies[position]
+                                for position in positions) + b']'
+
+
+def normalize(text):
+    """Регистр и «ё» не влияют на поиск."""
+    return text.casefold().replace('ё', 'е')
+
+
+def _deletions(text):
+    return {text} | {
+        text[:index] + text[index + 1:] for index in range(len(text))}
+
+
+def _prefix_distance(query, word):
+    """Расстояние от query до ближайшего по длине начала word.
+
+    Кандидат из индекса удалений отличается от запроса не больше чем на
+    две правки, поэтому для запросов не длиннее FUZZY_MAX_PREFIX хватает
+    сравнения строк с первого несовпадения; длинные сверяются полностью.
+    """
+    if word.startswith(query):
+        return 0
+    if _one_edit(query, word):
+        return 1
+    if len(query) <= FUZZY_MAX_PREFIX:
+        return FUZZY_MAX_DISTANCE
+    longest = min(len(query) + FUZZY_MAX_DISTANCE, len(word))
+    shortest = min(max(len(query) - FUZZY_MAX_DISTANCE, 1), longest)
+    return min(_distances(query, word[:longest])[shortest:])
+
+
+def _one_edit(query, word):
+    """Отличается ли начало word от query одной правкой."""
+    length = len(query)
+    start = 0
+    while start < min(length, len(word)) and query[start] == word[start]:
+        start += 1
+    rest = query[start + 1:]
+    return (
+        rest == word[start + 1:length]
+        or query[start:] == word[start + 1:length + 1]
+        or rest == word[start:length - 1]
+        or (rest[:1] == word[start:start + 1]
+            and query[start:start + 1] == word[start + 1:start + 2]
+            and rest[1:] == word[start + 2:length]))
+
+
+def _distances(first, second):
+    """Расстояния Дамерау — Левенштейна от first до начал second.
+
+    Элемент с индексом i — расстояние до second[:i]; перестановка
+    соседних букв считается одной правкой.
+    """
+    before, previous = None, list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        for column, second_char in enumerate(second, 1):
+            cost = first_char != second_char
+            value = min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + cost)
+            if (row > 1 and column > 1
+                    and first_char == second[column - 2]
+                    and first[row - 2] == second_char):
+                value = min(value, before[column - 2] + 1)
+            current.append(value)
+        before, previous = previous, current
+    return previous
+
+
+def _trigrams(text):
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+def _dump(data):
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+ingredient_index = IngredientIndex()
@@ -1,18 +1,23 @@
 import re
+from collections import Counter
 
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
 
-from api.helpers import Base64ImageField
-from recipes.constants import COOKING_MIN_TIME
-from recipes.models import (Favorite,
-                            Ingredient,
+from api.helpers import Base64ImageField, RenditionsField
+from api.loaders import UserRelationsLoader
+from recipes import shopping_cart
+from recipes.constants import COOKING_MIN_TIME, RECIPE_BATCH_MAX_SIZE
+from recipes.models import (Ingredient,
                             Recipe,
                             RecipeIngredient,
-                            ShoppingList,
+                            ShoppingCartItem,
                             Tag)
+from recipes.storage import is_stored_as
 from users.constants import USERNAME_MAX_LENGTH
-from users.models import Subscription, User
+from users.models import User
 
 
 class SignUpSerializer(UserCreateSerializer):
@@ -53,6 +58,8 @@ class UserSerializer(serializers.ModelSerializer):
 
     avatar = Base64ImageField()
 
+    avatar_renditions = RenditionsField('avatar')
+
     class Meta:
         model = User
         fields = (
@@ -62,12 +69,24 @@ class UserSerializer(serializers.ModelSerializer):
             'first_name',
             'last_name',
             'avatar',
+            'avatar_renditions',
             'is_subscribed')
 
     def get_is_subscribed(self, author):
-        user = self.context.get('request').user
-        return user.is_authenticated and user.subscriber.filter(
-            author=author).exists()
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return UserRelationsLoader.for_request(
+            self.context.get('request')).is_subscribed(author)
+
+
+class UserProfileSerializer(UserSerializer):
+    """Пользователь со счётчиками рецептов и подписок."""
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + (
+            'recipes_count',
+            'followers_count',
+            'following_count')
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -88,16 +107,22 @@ class TagSerializer(serializers.ModelSerializer):
 
 class IngredientSerializer(serializers.ModelSerializer):
 
+    measurement_unit = serializers.SlugRelatedField(
+        slug_field='name', read_only=True)
+
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
 
 class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
-    """Создание связи рецепт-ингредиент."""
+    """Создание связи рецепт-ингредиент.
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), source='ingredient')
+    id проверяется только как число: ингредиенты всего рецепта ищет
+    одним запросом RecipeWriteSerializer.validate.
+    """
+
+    id = serializers.IntegerField(min_value=1, source='ingredient')
 
     class Meta:
         model = RecipeIngredient
@@ -111,7 +136,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         queryset=Ingredient.objects.all(), source='ingredient')
 
     measurement_unit = serializers.CharField(
-        source='ingredient.measurement_unit')
+        source='ingredient.measurement_unit.name')
 
     name = serializers.CharField(source='ingredient.name')
 
@@ -124,6 +149,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     """Чтение рецепта."""
 
     image = Base64ImageField()
+    image_renditions = RenditionsField('image')
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -144,29 +170,38 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
+            'shopping_carts_count',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time')
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_subscribed_to_author'):
+            instance.author.is_subscribed = instance.is_subscribed_to_author
+        return super().to_representation(instance)
+
     def get_is_in_favorite(self, obj):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and request.user.favorite.filter(recipe=obj).exists())
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return UserRelationsLoader.for_request(
+            self.context.get('request')).is_favorited(obj)
 
     def get_is_in_shopping_list(self, obj):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and request.user.shopping_list.filter(recipe=obj).exists())
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return UserRelationsLoader.for_request(
+            self.context.get('request')).is_in_shopping_cart(obj)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Создание и изменение рецепта."""
 
     image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all())
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1))
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientWriteSerializer(
         many=True,
@@ -197,7 +232,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 'Отсутствует обязательное поле ingredients.')
 
         ingredients_ids = [
-            ingredient.get('ingredient').id for ingredient in ingredients]
+            ingredient.get('ingredient') for ingredient in ingredients]
 
         if len(set(ingredients_ids)) != len(ingredients):
             raise serializers.ValidationError(
@@ -207,6 +242,27 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Теги должны быть уникальными.')
 
+        # Все ссылки проверяются одним IN-запросом на модель, найденные
+        # объекты подставляются в attrs для create и update.
+        found_ingredients = Ingredient.objects.in_bulk(ingredients_ids)
+        found_tags = Tag.objects.in_bulk(tags)
+        errors = {}
+        missing_tags = [pk for pk in tags if pk not in found_tags]
+        if missing_tags:
+            errors['tags'] = 'Теги не найдены: {}.'.format(
+                ', '.join(map(str, missing_tags)))
+        missing_ingredients = [
+            pk for pk in ingredients_ids if pk not in found_ingredients]
+        if missing_ingredients:
+            errors['ingredients'] = 'Ингредиенты не найдены: {}.'.format(
+                ', '.join(map(str, missing_ingredients)))
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        attrs['tags'] = [found_tags[pk] for pk in tags]
+        for ingredient in ingredients:
+            ingredient['ingredient'] = found_ingredients[
+                ingredient['ingredient']]
         return attrs
 
     def validate_cooking_time(self, value):
@@ -220,15 +276,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 'Нужна фотография блюда.')
         return value
 
-    def tags_and_ingredients(self, recipe, tags, ingredients):
-        recipe.tags.set(tags)
-        RecipeIngredient.objects.bulk_create(
-            [
-                RecipeIngredient(recipe=recipe, **ingredient)
-                for ingredient in ingredients
-            ]
-        )
-
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe_ingredients')
@@ -236,18 +284,75 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(
             author=self.context['request'].user, **validated_data
         )
-        self.tags_and_ingredients(recipe, tags, ingredients)
+        recipe.tags.set(tags)
+        RecipeIngredient.objects.bulk_create(
+            [
+                RecipeIngredient(recipe=recipe, **ingredient)
+                for ingredient in ingredients
+            ]
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe_ingredients')
+        # set() сам сравнивает теги и меняет только разницу.
         instance.tags.set(tags)
-        instance.recipe_ingredients.all().delete()
-        self.tags_and_ingredients(instance, tags, ingredients)
+        old_amounts, new_amounts = self.update_ingredients(
+            instance, ingredients)
+        shopping_cart.change_recipe(instance.pk, old_amounts, new_amounts)
+        # Та же картинка не сохраняется заново и не пересобирает копии.
+        image = validated_data.get('image')
+        if image is not None and is_stored_as(instance.image, image):
+            del validated_data['image']
         return super().update(instance, validated_data)
 
+    def update_ingredients(self, recipe, ingredients):
+        """Пишет только разницу состава, возвращает старый и новый состав.
+
+        Удалённые строки удаляются одним DELETE, изменённые количества
+        обновляются одним UPDATE, новые строки вставляются одним INSERT.
+        """
+        current = {
+            line.ingredient_id: line
+            for line in recipe.recipe_ingredients.all()}
+        old_amounts = Counter({
+            ingredient_id: line.amount
+            for ingredient_id, line in current.items()})
+        new_amounts = Counter()
+        for ingredient in ingredients:
+            new_amounts[ingredient['ingredient'].pk] += ingredient['amount']
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            recipe.recipe_ingredients.filter(
+                ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, line in current.items():
+            if ingredient_id in new_amounts and (
+                    line.amount != new_amounts[ingredient_id]):
+                line.amount = new_amounts[ingredient_id]
+                changed.append(line)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        added = [
+            RecipeIngredient(recipe=recipe, **ingredient)
+            for ingredient in ingredients
+            if ingredient['ingredient'].pk not in current]
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        return old_amounts, new_amounts
+
     def to_representation(self, instance):
+        # Теги и состав только что записаны: читаем их пакетно, а не
+        # запросом на каждый ингредиент и его единицу измерения.
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient__measurement_unit')))
         return RecipeReadSerializer(
             instance, context={'request': self.context.get('request')}).data
 
@@ -257,68 +362,75 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
 
     image = Base64ImageField()
 
+    image_renditions = RenditionsField('image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         read_only_fields = ('__all__',)
 
 
-class BaseFavoriteShoppingSerializer(serializers.ModelSerializer):
-    """Базовый сериализатор для избранного и списка покупок."""
+class ShoppingCartItemSerializer(serializers.ModelSerializer):
+    """Строка сводки корзины: ингредиент и его общее количество."""
 
-    class Meta:
-        abstract = True
-
-    def validate(self, data):
-        user = data['user']
-        recipe = data['recipe']
-        model_name = self.Meta.model.__name__.lower()
-
-        if model_name == 'favorite':
-            if user.favorite.filter(recipe=recipe).exists():
-                raise serializers.ValidationError(
-                    'Рецепт уже добавлен в Избранное.')
-        if model_name == 'shoppinglist':
-            if user.shopping_list.filter(recipe=recipe).exists():
-                raise serializers.ValidationError(
-                    'Рецепт уже добавлен в Список покупок!')
-        return data
+    id = serializers.IntegerField(source='ingredient_id')
 
-    def to_representation(self, instance):
-        return ShortRecipeSerializer(instance.recipe).data
+    name = serializers.CharField(source='ingredient.name')
 
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit.name')
 
-class FavoriteSerializer(BaseFavoriteShoppingSerializer):
-    """Избранные рецепты."""
+    amount = serializers.IntegerField(source='total_amount')
 
     class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
+        model = ShoppingCartItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class ShoppingListSerializer(BaseFavoriteShoppingSerializer):
-    """Список покупок."""
+class RecipeBatchSerializer(serializers.Serializer):
+    """Рецепты для пакетного добавления в список и удаления из него."""
 
-    class Meta:
-        model = ShoppingList
-        fields = ('user', 'recipe')
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=RECIPE_BATCH_MAX_SIZE,
+        default=list)
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=RECIPE_BATCH_MAX_SIZE,
+        default=list)
+
+    def validate(self, attrs):
+        if not attrs['add'] and not attrs['remove']:
+            raise serializers.ValidationError(
+                'Нужен хотя бы один рецепт в add или remove.')
+        if set(attrs['add']) & set(attrs['remove']):
+            raise serializers.ValidationError(
+                'Рецепт не может быть одновременно в add и remove.')
+        # Повторы не нужны, порядок сохраняется для ответа.
+        return {
+            name: list(dict.fromkeys(ids)) for name, ids in attrs.items()}
 
 
 class ReadSubscriptionSerializer(serializers.ModelSerializer):
     """Получение информации о подписках."""
 
     recipes = serializers.SerializerMethodField(method_name='get_recipe')
-    recipes_count = serializers.SerializerMethodField(
-        method_name='get_recipes_count')
-    is_subscribed = serializers.BooleanField(default=True)
+    is_subscribed = serializers.SerializerMethodField(
+        method_name='get_is_subscribed')
+    avatar_renditions = RenditionsField('avatar')
 
     class Meta:
         model = User
-        fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
+        fields = UserProfileSerializer.Meta.fields + ('recipes',)
 
     def get_recipe(self, author):
-        recipes = author.recipes.all()
         request = self.context.get('request')
+        if hasattr(author, 'limited_recipes'):
+            return ShortRecipeSerializer(
+                author.limited_recipes,
+                many=True,
+                context={'request': request}).data
+        recipes = author.recipes.all()
         if 'recipes_limit' in self.context.get('request').GET:
             recipes_limit = self.context.get('request').GET['recipes_limit']
             if recipes_limit.isdigit():
@@ -328,36 +440,8 @@ class ReadSubscriptionSerializer(serializers.ModelSerializer):
             many=True,
             context={'request': request}).data
 
-    def get_recipes_count(self, user):
-        return user.recipes.count()
-
     def get_is_subscribed(self, user):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and request.user.subscriber.filter(author=user).exists())
-
-
-class SubscriptionSerializer(serializers.ModelSerializer):
-    """Создание подписки."""
-
-    class Meta:
-        model = Subscription
-        fields = '__all__'
-
-    def validate(self, attrs):
-        subscriber = attrs['subscriber']
-        author = attrs['author']
-
-        if subscriber == author:
-            raise serializers.ValidationError('Нельзя подписаться на себя.')
-
-        is_subscription_exists = Subscription.objects.filter(
-            subscriber=subscriber, author=author).exists()
-        if is_subscription_exists:
-            raise serializers.ValidationError('Вы уже подписаны.')
-        return attrs
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        return ReadSubscriptionSerializer(
-            instance.author, context={'request': request}).data
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
+        return UserRelationsLoader.for_request(
+            self.context.get('request')).is_subscribed(user)
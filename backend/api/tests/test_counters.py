@@ -0,0 +1,84 @@
+"""Хранимые счётчики рецептов и пользователей."""
+from unittest import mock
+
+from django.db.models import F
+from django.urls import reverse
+from rest_framework import status
+
+from recipes import counters
+from recipes.models import Recipe
+from users.models import Subscription, User
+from .utils import FoodgramTestCase, create_user
+
+RECIPES_COUNT = 2
+
+
+class CountersTest(FoodgramTestCase):
+    """Счётчики меняются только выражениями F() и не расходятся."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            cls.create_recipe(f'Рецепт {number}')
+            for number in range(RECIPES_COUNT)]
+        cls.other = create_user('other')
+        for author in (cls.author, cls.other):
+            Subscription.objects.create(subscriber=cls.user, author=author)
+
+    def test_counters_follow_changes(self):
+        recipe = self.recipes[0]
+        for url_name in ('recipe-favorite', 'recipe-shopping-list'):
+            self.client.post(
+                reverse(f'api:{url_name}', kwargs={'pk': recipe.pk}))
+        self.client.delete(
+            reverse('api:user-subscribe', kwargs={'id': self.other.pk}))
+        data = self.client.get(
+            reverse('api:recipe-detail', kwargs={'pk': recipe.pk})).json()
+        self.assertEqual(data['favorites_count'], 1)
+        self.assertEqual(data['shopping_carts_count'], 1)
+        data = self.client.get(
+            reverse('api:user-detail', kwargs={'id': self.user.pk})).json()
+        self.assertEqual(data['following_count'], 1)
+        data = self.client.get(
+            reverse('api:user-detail', kwargs={'id': self.author.pk})).json()
+        self.assertEqual(data['recipes_count'], RECIPES_COUNT)
+        self.assertEqual(data['followers_count'], 1)
+        self.assertEqual(set(counters.drift().values()), {0})
+        self.client.delete(
+            reverse('api:recipe-favorite', kwargs={'pk': recipe.pk}))
+        self.other.delete()
+        self.author.delete()
+        self.assertEqual(set(counters.drift().values()), {0})
+
+    def test_save_keeps_concurrent_increments(self):
+        recipe = self.recipes[0]
+
+        def like(*args):
+            # Лайк приходит, пока правка рецепта ещё не сохранена.
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=F('favorites_count') + 1)
+
+        with mock.patch(
+                'api.serializers.shopping_cart.change_recipe',
+                side_effect=like):
+            response = self.author_client().patch(
+                reverse('api:recipe-detail', kwargs={'pk': recipe.pk}),
+                {'name': 'Оладьи', 'text': 'Смешать и пожарить.',
+                 'cooking_time': 15, 'tags': [self.tags[0].pk],
+                 'ingredients': [
+                     {'id': self.ingredients[0].pk, 'amount': 100}]},
+                format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        self.assertEqual(recipe.name, 'Оладьи')
+        self.assertEqual(recipe.favorites_count, 1)
+
+        author = User.objects.get(pk=self.author.pk)
+        User.objects.filter(pk=self.author.pk).update(
+            followers_count=F('followers_count') + 2)
+        author.set_password('N3wPa55w0rd!')
+        author.save()
+        author = User.objects.get(pk=self.author.pk)
+        self.assertTrue(author.check_password('N3wPa55w0rd!'))
+        self.assertEqual(author.followers_count, 3)
@@ -0,0 +1,81 @@
+"""Выгрузка списка покупок."""
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from recipes.models import Ingredient, RecipeIngredient, ShoppingList
+from .utils import MEDIA_ROOT, FoodgramTestCase
+
+EXPORT_ROOT = f'{MEDIA_ROOT}/exports'
+
+
+class ShoppingCartExportTest(FoodgramTestCase):
+    """Форматы, ETag, X-Accel-Redirect и сложение единиц."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(2):
+            ShoppingList.objects.create(
+                user=cls.user,
+                recipe=cls.create_recipe(f'Рецепт {number}', number + 1))
+
+    def export_url(self, export_type=None):
+        url = reverse('api:recipe-make-shopping-list')
+        return f'{url}?type={export_type}' if export_type else url
+
+    def test_formats_and_revalidation(self):
+        for export_type, marker in (('txt', 'ингредиент 0 (г) — 3'),
+                                    ('csv', 'Количество'),
+                                    ('html', '<table>')):
+            url = self.export_url(export_type)
+            with self.subTest(type=export_type):
+                response = self.client.get(url)
+                body = b''.join(response.streaming_content)
+                self.assertIn(marker, body.decode())
+                etag = response.headers['ETag']
+                self.assertEqual(self.client.get(url).content, body)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingList.objects.filter(user=self.user).first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        response = self.client.get(self.export_url('pdf'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(EXPORT_ACCEL_REDIRECT=True, EXPORT_ROOT=EXPORT_ROOT)
+    def test_accel_redirect(self):
+        url = self.export_url('csv')
+        response = self.client.get(url)
+        self.assertEqual(response.content, b'')
+        path = response.headers['X-Accel-Redirect']
+        self.assertTrue(path.startswith(f'/protected/exports/{self.user.pk}/'))
+        with open(path.replace('/protected/exports', EXPORT_ROOT),
+                  encoding='utf-8') as file:
+            self.assertIn('Количество', file.read())
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        self.assertEqual(
+            self.client.get(url).headers['X-Accel-Redirect'], path)
+
+    def test_merges_compatible_units(self):
+        recipe = self.create_recipe('Сладкое')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.recipe_ingredients.all().delete()
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=2)
+                for ingredient in Ingredient.objects.bulk_create((
+                    Ingredient(name='сахар', measurement_unit=self.units['г']),
+                    Ingredient(
+                        name='сахар', measurement_unit=self.units['кг']),
+                    Ingredient(
+                        name='соль', measurement_unit=self.units['ч. л.']),
+                )))
+            ShoppingList.objects.create(user=self.user, recipe=recipe)
+        response = self.client.get(self.export_url())
+        lines = b''.join(response.streaming_content).decode().split('\n')
+        self.assertIn('сахар (г) — 2002', lines)
+        self.assertIn('соль (ч. л.) — 2', lines)
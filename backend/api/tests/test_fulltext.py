@@ -0,0 +1,96 @@
+"""Полнотекстовый поиск рецептов (FTS5 на SQLite, tsvector на PostgreSQL)."""
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from recipes.models import (Ingredient,
+                            MeasurementUnit,
+                            Recipe,
+                            RecipeIngredient)
+from users.models import User
+
+
+# Картинок у рецептов нет, копии собирать не из чего.
+@mock.patch('recipes.renditions.schedule')
+class RecipeSearchTest(APITestCase):
+    """Ранжирование и поддержка индекса в актуальном состоянии."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.unit = MeasurementUnit.objects.resolve(('г',))['г']
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='Pa55w0rd!')
+
+    def create(self, name, text='Смешать и подать.', ingredients=()):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name=name, text=text, cooking_time=10,
+                image='images/recipe.gif')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in ingredients)
+            # Как и API, состав пишется в одной транзакции с рецептом.
+            recipe.save()
+        return recipe
+
+    def search(self, query):
+        response = self.client.get(
+            reverse('api:recipe-list'), {'search': query})
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_name_ranks_above_ingredients_and_text(self, schedule):
+        lentils = Ingredient.objects.create(
+            name='чечевица', measurement_unit=self.unit)
+        self.create('Рагу', text='Добавить чечевицу в конце.')
+        self.create('Похлёбка', ingredients=[lentils])
+        self.create('Чечевичный суп')
+        self.assertEqual(
+            self.search('чечеви'), ['Чечевичный суп', 'Похлёбка', 'Рагу'])
+
+    def test_index_follows_changes(self, schedule):
+        recipe = self.create('Блины')
+        self.assertEqual(self.search('блины'), ['Блины'])
+        recipe.name = 'Оладьи'
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(self.search('блины'), [])
+        self.assertEqual(self.search('оладьи'), ['Оладьи'])
+
+        flour = Ingredient.objects.create(
+            name='мука', measurement_unit=self.unit)
+        self.create('Хлеб', ingredients=[flour])
+        self.assertEqual(self.search('мука'), ['Хлеб'])
+        flour.name = 'полба'
+        with self.captureOnCommitCallbacks(execute=True):
+            flour.save()
+        self.assertEqual(self.search('мука'), [])
+        self.assertEqual(self.search('полба'), ['Хлеб'])
+        with self.captureOnCommitCallbacks(execute=True):
+            flour.delete()
+        self.assertEqual(self.search('полба'), [])
+
+        recipe.delete()
+        self.assertEqual(self.search('оладьи'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'tsvector есть только в PG')
+    def test_search_vector_weights(self, schedule):
+        flour = Ingredient.objects.create(
+            name='мука', measurement_unit=self.unit)
+        recipe = self.create(
+            'Блины', text='Смешать муку с молоком.', ingredients=[flour])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT lexeme, weights FROM recipes_recipe, '
+                'unnest(search_vector) WHERE id = %s', (recipe.pk,))
+            weights = {
+                lexeme: set(lexeme_weights)
+                for lexeme, lexeme_weights in cursor.fetchall()}
+        # Слова приведены к основе, вес — по полю: A, B, C.
+        self.assertEqual(weights['блин'], {'A'})
+        self.assertEqual(weights['мук'], {'B', 'C'})
+        self.assertEqual(weights['молок'], {'C'})
+        self.assertEqual(self.search('молоко'), ['Блины'])
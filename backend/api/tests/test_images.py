@@ -0,0 +1,112 @@
+"""Загрузка изображений, миниатюры и сборка мусора в медиа."""
+from io import StringIO
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from recipes.models import Recipe
+from users.models import User
+from .utils import (GIF,
+                    INGREDIENTS_PER_RECIPE,
+                    PNG_BASE64,
+                    FoodgramTestCase)
+
+
+class RecipeImagesTest(FoodgramTestCase):
+    """Миниатюры, multipart-загрузка и дедупликация файлов."""
+
+    def test_image_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('api:recipe-list'), self.recipe_payload(),
+                format='json')
+        self.assertEqual(response.data['image_renditions'], {})
+        url = reverse('api:recipe-detail', kwargs={'pk': response.data['id']})
+        renditions = self.client.get(url).json()['image_renditions']
+        self.assertEqual(set(renditions), {'small', 'medium', 'large'})
+        self.assertTrue(renditions['small']['webp'].endswith('.webp'))
+        data = self.client.get(reverse('api:recipe-list')).json()
+        self.assertEqual(
+            data['results'][0]['image'], renditions['small']['webp'])
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        for formats in recipe.image_renditions['sizes'].values():
+            for name, path in formats.items():
+                # Раскладка, которую nginx кэширует как неизменяемую.
+                self.assertRegex(
+                    path, r'^images/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{40}\.'
+                    + ('webp' if name == 'webp' else 'jpg') + '$')
+                self.assertTrue(recipe.image.storage.exists(path))
+
+    def test_multipart_image_upload(self):
+        payload = self.recipe_payload()
+        data = {
+            key: payload[key] for key in ('name', 'text', 'cooking_time')}
+        data['tags'] = payload['tags']
+        for index, ingredient in enumerate(payload['ingredients']):
+            data[f'ingredients[{index}]id'] = ingredient['id']
+            data[f'ingredients[{index}]amount'] = ingredient['amount']
+        data['image'] = SimpleUploadedFile('recipe.gif', GIF)
+        response = self.client.post(
+            reverse('api:recipe-list'), data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            len(response.data['ingredients']), INGREDIENTS_PER_RECIPE)
+        url = reverse('api:user-avatar')
+        response = self.client.put(
+            url, {'avatar': SimpleUploadedFile('avatar.gif', GIF)},
+            format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Не картинка отсекается по заголовку, до разбора Pillow.
+        with mock.patch('PIL.Image.open') as image_open:
+            response = self.client.put(
+                url, {'avatar': SimpleUploadedFile('avatar.gif', b'<html>')},
+                format='multipart')
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.put(url, {
+                'avatar': 'data:image/png;base64,PGh0bWw+PC9odG1sPg=='})
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST)
+        image_open.assert_not_called()
+
+    def test_avatar_renditions_in_subscriptions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author_client().put(
+                reverse('api:user-avatar'), {'avatar': PNG_BASE64})
+        expected = self.client.get(reverse(
+            'api:user-detail', kwargs={'id': self.author.pk}
+        )).json()['avatar_renditions']
+        self.assertTrue(expected['small']['webp'].startswith('http://'))
+        response = self.client.post(
+            reverse('api:user-subscribe', kwargs={'id': self.author.pk}))
+        self.assertEqual(response.json()['avatar_renditions'], expected)
+        data = self.client.get(reverse('api:user-get-subscribtions')).json()
+        self.assertEqual(data['results'][0]['avatar_renditions'], expected)
+
+    def test_media_deduplicated_and_collected(self):
+        payload = dict(self.recipe_payload(), image=PNG_BASE64)
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = [
+                self.client.post(
+                    reverse('api:recipe-list'), payload,
+                    format='json').data['id']
+                for _ in range(2)]
+        first, second = Recipe.objects.filter(pk__in=ids)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^images/\w\w/\w\w/\w{40}\.png$')
+        rendition = first.image_renditions['sizes']['small']['webp']
+        self.client.put(reverse('api:user-avatar'), {'avatar': PNG_BASE64})
+        avatar = User.objects.get(pk=self.user.pk).avatar.name
+        self.client.delete(reverse('api:user-avatar'))
+        first.delete()
+        call_command('collect_media_garbage', min_age=0, stdout=StringIO())
+        self.assertTrue(default_storage.exists(second.image.name))
+        self.assertTrue(default_storage.exists(rendition))
+        self.assertFalse(default_storage.exists(avatar))
+        Recipe.objects.filter(pk=second.pk).update(image_renditions={})
+        call_command('collect_media_garbage', min_age=0, stdout=StringIO())
+        self.assertFalse(default_storage.exists(rendition))
@@ -0,0 +1,67 @@
+"""Импорт рецептов из NDJSON."""
+from io import StringIO
+import json
+import os
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Recipe
+from recipes.versions import USERS, get_version, item
+from users.models import User
+from .utils import INGREDIENTS_PER_RECIPE, MEDIA_ROOT, FoodgramTestCase
+
+
+class ImportRecipesTest(FoodgramTestCase):
+    """Команда import_recipes."""
+
+    def run_import(self, lines, stderr=None):
+        path = os.path.join(MEDIA_ROOT, 'import.ndjson')
+        with open(path, 'w', encoding='UTF-8') as file:
+            for data in lines:
+                file.write(json.dumps(data) + '\n')
+            file.write('{\n')
+        stderr = stderr or StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                'import_recipes', path, author=self.author.email,
+                workers=1, stdout=StringIO(), stderr=stderr)
+        return len(queries), stderr.getvalue()
+
+    def test_import_recipes(self):
+        payload = self.recipe_payload()
+        missing = dict(payload, tags=[10 ** 6])
+        broken = dict(payload, image='data:image/gif;base64,R0lGODlh')
+        few, _ = self.run_import([payload] * 2)
+        version = get_version(item(USERS, self.author.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            many, errors = self.run_import(
+                [payload] * 20 + [missing, broken])
+        # Запросов на пачку столько же, сколько бы в ней ни было рецептов.
+        self.assertEqual(few, many, 'Импорт делает запросы на каждый рецепт.')
+        self.assertIn('Строка 21: tags: Теги не найдены: 1000000.', errors)
+        self.assertIn('Строка 22: image:', errors)
+        self.assertIn('Строка 23: non_field_errors:', errors)
+        recipes = Recipe.objects.filter(author=self.author)
+        self.assertEqual(recipes.count(), 22)
+        self.assertEqual(User.objects.get(pk=self.author.pk).recipes_count, 22)
+        recipe = recipes.first()
+        self.assertEqual(recipe.tags.count(), len(self.tags))
+        self.assertEqual(
+            recipe.recipe_ingredients.count(), INGREDIENTS_PER_RECIPE)
+        self.assertTrue(recipe.image_renditions)
+        # Кэшированные представления рецептов автора устарели.
+        self.assertNotEqual(get_version(item(USERS, self.author.pk)), version)
+
+    def test_failed_batch_reports_orphaned_images(self):
+        stderr = StringIO()
+        with mock.patch(
+                'recipes.management.commands.import_recipes.counters.'
+                'links_added', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.run_import([self.recipe_payload()] * 2, stderr)
+        self.assertFalse(Recipe.objects.filter(author=self.author).exists())
+        self.assertIn('картинок без рецептов: 2', stderr.getvalue())
+        self.assertIn('collect_media_garbage', stderr.getvalue())
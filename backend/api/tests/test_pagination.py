@@ -0,0 +1,46 @@
+"""Номера страниц с приблизительным количеством."""
+from unittest import mock
+
+from django.urls import reverse
+from rest_framework import status
+
+from .utils import FoodgramTestCase
+
+RECIPES_COUNT = 8
+PAGE_SIZE = 6
+
+
+class ApproximateCountTest(FoodgramTestCase):
+    """Завышенная оценка планировщика уточняется по неполной странице."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(RECIPES_COUNT):
+            cls.create_recipe(f'Рецепт {number}')
+
+    def get_page(self, page):
+        return self.client.get(
+            reverse('api:recipe-list'), {'page': page, 'limit': PAGE_SIZE})
+
+    @mock.patch('api.pagination._planner_estimate', return_value=20_000)
+    def test_short_page_corrects_estimate(self, planner_estimate):
+        data = self.get_page(1).json()
+        self.assertEqual(data['count'], 20_000)
+        self.assertTrue(data['count_approximate'])
+        data = self.get_page(2).json()
+        self.assertEqual(data['count'], RECIPES_COUNT)
+        self.assertFalse(data['count_approximate'])
+        self.assertIsNone(data['next'])
+        # Уточнённое количество кэшируется вместо оценки.
+        data = self.get_page(1).json()
+        self.assertEqual(data['count'], RECIPES_COUNT)
+        self.assertFalse(data['count_approximate'])
+
+    @mock.patch('api.pagination._planner_estimate', return_value=20_000)
+    def test_empty_page_past_the_end(self, planner_estimate):
+        self.assertEqual(
+            self.get_page(5).status_code, status.HTTP_404_NOT_FOUND)
+        data = self.get_page(1).json()
+        self.assertEqual(data['count'], RECIPES_COUNT)
+        self.assertEqual(planner_estimate.call_count, 1)
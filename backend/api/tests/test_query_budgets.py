@@ -0,0 +1,449 @@
+"""Бюджеты SQL-запросов для эндпоинтов API.
+
+Каждый маршрут из api/urls.py вызывается анонимно и от имени
+пользователя с токеном. Тест падает, если эндпоинт превысил объявленный
+бюджет или если число запросов растёт вместе с размером страницы;
+в сообщении об ошибке выводятся все выполненные запросы.
+"""
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import urls as api_urls
+from api.representations import recipe_representations
+from recipes import counters, shopping_cart
+from recipes.models import Favorite, Recipe, ShoppingList, Tag
+from recipes.versions import (CARTS,
+                              INGREDIENTS,
+                              RECIPES,
+                              TAGS,
+                              USERS,
+                              get_versions,
+                              item)
+from users.models import Subscription, User
+from .utils import (GIF_BASE64,
+                    INGREDIENTS_COUNT,
+                    INGREDIENTS_PER_RECIPE,
+                    FoodgramTestCase,
+                    create_recipe,
+                    create_user)
+
+USERS_COUNT = 12
+RECIPES_PER_USER = 3
+
+ANON = 'anon'
+AUTH = 'auth'
+
+# (имя маршрута, kwargs маршрута, query string, бюджет anon, бюджет auth).
+# Для авторизованного клиента бюджет включает поиск токена. Кэш перед
+# каждым запросом пуст, так что рецепты считаются с промахом кэша, а
+# версии кэшей читаются из базы (конфигурация без REDIS_URL). Готовые
+# тела справочников живут в памяти процесса, их бюджет — на сборку тела.
+READ_BUDGETS = (
+    ('api-root', {}, '', 0, 1),
+    ('user-list', {}, '', 2, 4),
+    ('user-detail', {'id': 'author'}, '', 2, 3),
+    ('user-me', {}, '', 0, 2),
+    ('user-get-subscribtions', {}, 'recipes_limit=2', 0, 4),
+    ('tag-list', {}, '', 2, 2),
+    ('tag-detail', {'pk': 'tag'}, '', 1, 1),
+    ('ingredient-list', {}, 'name=ингр', 2, 2),
+    ('ingredient-detail', {'pk': 'ingredient'}, '', 1, 1),
+    ('recipe-list', {}, '', 6, 7),
+    ('recipe-list', {}, 'is_favorited=1&is_in_shopping_cart=1', 6, 7),
+    ('recipe-list', {}, 'tags=breakfast&author=author', 8, 9),
+    ('recipe-list', {}, 'cursor=&tags=breakfast&author=author', 7, 8),
+    ('recipe-detail', {'pk': 'recipe'}, '', 5, 6),
+    ('recipe-get-short-link', {'pk': 'recipe'}, '', 1, 2),
+    ('recipe-shopping-cart-summary', {}, '', 0, 2),
+    ('recipe-make-shopping-list', {}, '', 0, 3),
+)
+
+# Списки с номерами страниц: на PostgreSQL при пустом кэше они ещё
+# спрашивают у планировщика оценку числа строк (EXPLAIN).
+COUNTED = ('user-list', 'user-get-subscribtions', 'recipe-list')
+
+# Списки, число запросов которых не должно зависеть от размера страницы.
+PAGINATED = (
+    ('user-list', ''),
+    ('user-get-subscribtions', 'recipes_limit=2'),
+    ('recipe-list', ''),
+    ('recipe-list', 'is_favorited=1'),
+    ('recipe-list', 'cursor='),
+    ('user-get-subscribtions', 'cursor=&recipes_limit=2'),
+)
+
+# Маршруты записи, покрытые WriteQueryBudgetTest.
+WRITE_ROUTES = (
+    'recipe-favorite',
+    'recipe-shopping-list',
+    'recipe-favorite-batch',
+    'recipe-shopping-cart-batch',
+    'user-subscribe',
+    'user-avatar',
+    'user-set-password',
+    'login',
+    'logout',
+)
+
+# Маршруты djoser, завязанные на отправку писем; проверяются отдельно.
+EMAIL_FLOW_ROUTES = (
+    'user-activation',
+    'user-resend-activation',
+    'user-reset-password',
+    'user-reset-password-confirm',
+    'user-reset-username',
+    'user-reset-username-confirm',
+    'user-set-username',
+)
+
+
+class QueryBudgetTestCase(FoodgramTestCase):
+    """Общие данные и проверки для тестов бюджетов.
+
+    Версии кэшей лежат в базе, как в конфигурации по умолчанию (без
+    REDIS_URL); строки версий создаются заранее, как после первого
+    обращения к ним в работающем сервисе.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.users = [cls.user, cls.author] + [
+            create_user(f'user{i}') for i in range(USERS_COUNT - 2)]
+        cls.token = Token.objects.create(user=cls.user)
+        for number, author in enumerate(cls.users):
+            for i in range(RECIPES_PER_USER):
+                create_recipe(
+                    author, cls.tags[:i + 1],
+                    [cls.ingredients[(number + i + j) % INGREDIENTS_COUNT]
+                     for j in range(INGREDIENTS_PER_RECIPE)],
+                    f'Рецепт {number}-{i}')
+        cls.recipe = Recipe.objects.filter(author=cls.author).first()
+        recipes = Recipe.objects.exclude(author=cls.user)[:10]
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes)
+        ShoppingList.objects.bulk_create(
+            ShoppingList(user=cls.user, recipe=recipe) for recipe in recipes)
+        Subscription.objects.bulk_create(
+            Subscription(subscriber=cls.user, author=author)
+            for author in cls.users[1:])
+        shopping_cart.rebuild()
+        counters.reconcile()
+        get_versions(
+            [TAGS, INGREDIENTS]
+            + [item(RECIPES, pk) for pk in Recipe.objects.values_list(
+                'pk', flat=True)]
+            + [item(name, user.pk)
+               for user in cls.users for name in (USERS, CARTS)])
+
+    def get_client(self, who):
+        client = APIClient()
+        if who == AUTH:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client
+
+    def resolve(self, url_name, kwargs, query=''):
+        objects = {
+            'author': self.author.pk,
+            'recipe': self.recipe.pk,
+            'tag': self.tags[0].pk,
+            'ingredient': self.ingredients[0].pk,
+        }
+        url = reverse(
+            f'api:{url_name}',
+            kwargs={key: objects.get(value, value)
+                    for key, value in kwargs.items()})
+        query = query.replace('author=author', f'author={self.author.pk}')
+        return f'{url}?{query}' if query else url
+
+    def count_queries(self, who, method, url, data=None):
+        client = self.get_client(who)
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, data, format='json')
+            if response.streaming:
+                # Потоковое тело читает базу по мере отдачи.
+                response.streaming_content = [
+                    b''.join(response.streaming_content)]
+        return response, context.captured_queries
+
+    def assertWithinBudget(self, budget, who, method, url, data=None):
+        response, queries = self.count_queries(who, method, url, data)
+        self.assertLess(
+            response.status_code,
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            f'{method.upper()} {url} ({who}) завершился ошибкой.')
+        if len(queries) > budget:
+            self.fail(
+                f'{method.upper()} {url} ({who}): {len(queries)} SQL-запросов '
+                f'при бюджете {budget}.\n' + _format_queries(queries))
+        return response
+
+
+class ReadQueryBudgetTest(QueryBudgetTestCase):
+    """Чтение: фиксированный бюджет и отсутствие N+1."""
+
+    def test_every_route_has_budget(self):
+        covered = {budget[0] for budget in READ_BUDGETS}
+        covered.update(WRITE_ROUTES, EMAIL_FLOW_ROUTES)
+        self.assertEqual(_route_names(api_urls.urlpatterns) - covered, set())
+
+    def test_read_endpoints_within_budget(self):
+        for url_name, kwargs, query, anon_budget, auth_budget in READ_BUDGETS:
+            url = self.resolve(url_name, kwargs, query)
+            extra = _planner_queries(url_name, query)
+            for who, budget in ((ANON, anon_budget), (AUTH, auth_budget)):
+                with self.subTest(url=url, who=who):
+                    cache.clear()
+                    self.assertWithinBudget(budget + extra, who, 'get', url)
+
+    def test_queries_do_not_grow_with_page_size(self):
+        for url_name, query in PAGINATED:
+            small = self.resolve(url_name, {}, f'{query}&limit=2')
+            large = self.resolve(url_name, {}, f'{query}&limit=10')
+            with self.subTest(url=url_name, query=query):
+                # Оба запроса с пустым кэшем, в том числе кэшем count.
+                cache.clear()
+                small_response, small_queries = self.count_queries(
+                    AUTH, 'get', small)
+                cache.clear()
+                large_response, large_queries = self.count_queries(
+                    AUTH, 'get', large)
+                self.assertEqual(
+                    small_response.status_code, status.HTTP_200_OK)
+                self.assertGreater(
+                    len(large_response.data['results']),
+                    len(small_response.data['results']))
+                if len(large_queries) != len(small_queries):
+                    self.fail(
+                        f'{url_name}: {len(small_queries)} запросов при '
+                        f'limit=2 и {len(large_queries)} при limit=10.\n'
+                        + _format_queries(large_queries))
+
+    def test_recipe_representations_from_cache(self):
+        list_url = self.resolve('recipe-list', {}, 'limit=10')
+        detail_url = self.resolve('recipe-detail', {'pk': 'recipe'})
+        self.count_queries(ANON, 'get', list_url)
+        self.count_queries(ANON, 'get', detail_url)
+        hits, _ = recipe_representations.stats()
+        anon = self.assertWithinBudget(3, ANON, 'get', list_url)
+        auth = self.assertWithinBudget(4, AUTH, 'get', list_url)
+        self.assertWithinBudget(2, ANON, 'get', detail_url)
+        self.assertEqual(recipe_representations.stats()[0], hits + 21)
+        favorites = set(self.user.favorite.values_list('recipe_id', flat=True))
+        for anon_data, auth_data in zip(
+                anon.data['results'], auth.data['results']):
+            self.assertFalse(anon_data['is_favorited'])
+            self.assertFalse(anon_data['author']['is_subscribed'])
+            self.assertEqual(
+                auth_data['is_favorited'], auth_data['id'] in favorites)
+            self.assertEqual(
+                auth_data['author']['is_subscribed'],
+                auth_data['author']['id'] != self.user.pk)
+            self.assertTrue(auth_data['image'].startswith('http://'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Переименован'
+            self.author.save()
+        response = self.client.get(detail_url)
+        self.assertEqual(response.data['author']['first_name'], 'Переименован')
+
+    # Оценка планировщика недоступна, как на SQLite: первый подсчёт точный.
+    @mock.patch('api.pagination._planner_estimate', return_value=None)
+    @mock.patch('api.pagination.APPROXIMATE_COUNT_THRESHOLD', 10)
+    def test_large_counts_are_reused(self, planner_estimate):
+        url = self.resolve('recipe-list', {}, 'is_favorited=1')
+        first, first_queries = self.count_queries(AUTH, 'get', url)
+        second, second_queries = self.count_queries(AUTH, 'get', url)
+        self.assertEqual(first.data['count'], second.data['count'])
+        self.assertFalse(first.data['count_approximate'])
+        self.assertTrue(second.data['count_approximate'])
+        self.assertLess(len(second_queries), len(first_queries))
+        small = self.resolve('recipe-list', {}, 'author=author')
+        response = self.get_client(ANON).get(small)
+        self.assertEqual(response.data['count'], RECIPES_PER_USER)
+        self.assertFalse(response.data['count_approximate'])
+
+    def test_shopping_cart_export(self):
+        client = self.get_client(AUTH)
+        for export_type in ('txt', 'csv', 'html'):
+            url = self.resolve('recipe-make-shopping-list', {},
+                               f'type={export_type}')
+            with self.subTest(type=export_type):
+                response = self.assertWithinBudget(3, AUTH, 'get', url)
+                etag = response.headers['ETag']
+                with CaptureQueriesContext(connection) as context:
+                    client.get(url)
+                    client.get(url, HTTP_IF_NONE_MATCH=etag)
+                # Остаются только поиск токена и чтение версий.
+                self.assertEqual(len(context.captured_queries), 4)
+
+    def test_reference_data_revalidation(self):
+        for url in (self.resolve('tag-list', {}),
+                    self.resolve('ingredient-list', {}),
+                    self.resolve('ingredient-list', {}, 'name=ингр')):
+            for who in (ANON, AUTH):
+                with self.subTest(url=url, who=who):
+                    client = self.get_client(who)
+                    etag = client.get(url).headers['ETag']
+                    with CaptureQueriesContext(connection) as context:
+                        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(
+                        response.status_code, status.HTTP_304_NOT_MODIFIED)
+                    # Остаётся только чтение версии справочника.
+                    self.assertEqual(
+                        len(context.captured_queries), 1,
+                        _format_queries(context.captured_queries))
+        url = self.resolve('tag-list', {})
+        etag = self.client.get(url).headers['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='перекус', slug='snack')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), len(self.tags) + 1)
+
+
+class WriteQueryBudgetTest(QueryBudgetTestCase):
+    """Запись: добавление/удаление связей, рецепты, профиль."""
+
+    def test_favorite_and_shopping_cart(self):
+        recipe = Recipe.objects.filter(author=self.author).last()
+        # Корзина дополнительно правит суммы ShoppingCartItem.
+        for url_name, post_budget, delete_budget in (
+                ('recipe-favorite', 6, 5),
+                ('recipe-shopping-list', 8, 8)):
+            url = self.resolve(url_name, {'pk': recipe.pk})
+            with self.subTest(url=url):
+                self.assertWithinBudget(1, ANON, 'post', url)
+                response = self.assertWithinBudget(
+                    post_budget, AUTH, 'post', url)
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                response = self.assertWithinBudget(
+                    delete_budget, AUTH, 'delete', url)
+                self.assertEqual(
+                    response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_batch_favorite_and_shopping_cart(self):
+        recipes = list(Recipe.objects.filter(
+            author=self.author).values_list('pk', flat=True))
+        # Корзина дополнительно правит суммы ShoppingCartItem.
+        for url_name, add_budget, mixed_budget in (
+                ('recipe-favorite-batch', 6, 7),
+                ('recipe-shopping-cart-batch', 7, 9)):
+            url = self.resolve(url_name, {})
+            with self.subTest(url=url):
+                self.assertWithinBudget(1, ANON, 'post', url, {'add': recipes})
+                response = self.assertWithinBudget(
+                    add_budget, AUTH, 'post', url, {'add': recipes})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                response = self.assertWithinBudget(
+                    mixed_budget, AUTH, 'post', url,
+                    {'add': recipes[:1], 'remove': recipes[1:]})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+        url = self.resolve('recipe-shopping-cart-summary', {})
+        response = self.assertWithinBudget(6, AUTH, 'delete', url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_subscribe(self):
+        author = User.objects.create_user(
+            username='new_author', email='new_author@foodgram.ru',
+            password='Pa55w0rd!')
+        url = self.resolve('user-subscribe', {'id': author.pk})
+        self.assertWithinBudget(0, ANON, 'post', url)
+        response = self.assertWithinBudget(9, AUTH, 'post', url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.assertWithinBudget(6, AUTH, 'delete', url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_recipe_create_update_delete(self):
+        list_url = self.resolve('recipe-list', {})
+        self.assertWithinBudget(0, ANON, 'post', list_url)
+        response = self.assertWithinBudget(
+            15, AUTH, 'post', list_url, self.recipe_payload())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = self.resolve('recipe-detail', {'pk': response.data['id']})
+        response = self.assertWithinBudget(
+            12, AUTH, 'patch', url, self.recipe_payload())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.assertWithinBudget(13, AUTH, 'delete', url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_recipe_missing_references(self):
+        payload = self.recipe_payload()
+        payload['tags'].append(10 ** 6)
+        payload['ingredients'] += [
+            {'id': 10 ** 6 + 1, 'amount': 1}, {'id': 10 ** 6 + 2, 'amount': 1}]
+        response = self.assertWithinBudget(
+            3, AUTH, 'post', self.resolve('recipe-list', {}), payload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {
+            'tags': ['Теги не найдены: 1000000.'],
+            'ingredients': ['Ингредиенты не найдены: 1000001, 1000002.']})
+
+    def test_avatar(self):
+        url = self.resolve('user-avatar', {})
+        self.assertWithinBudget(0, ANON, 'put', url, {'avatar': GIF_BASE64})
+        response = self.assertWithinBudget(
+            3, AUTH, 'put', url, {'avatar': GIF_BASE64})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.assertWithinBudget(3, AUTH, 'delete', url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_user_create_and_set_password(self):
+        response = self.assertWithinBudget(
+            5, ANON, 'post', self.resolve('user-list', {}), {
+                'email': 'someone@foodgram.ru',
+                'username': 'someone',
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'password': 'Pa55w0rd!'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.assertWithinBudget(
+            3, AUTH, 'post', self.resolve('user-set-password', {}), {
+                'current_password': 'Pa55w0rd!',
+                'new_password': 'N3wPa55w0rd!'})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_token_login_logout(self):
+        response = self.assertWithinBudget(
+            6, ANON, 'post', reverse('api:login'), {
+                'email': self.author.email, 'password': 'Pa55w0rd!'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.assertWithinBudget(
+            2, AUTH, 'post', reverse('api:logout'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_email_flow_routes(self):
+        for url_name in EMAIL_FLOW_ROUTES:
+            url = self.resolve(url_name, {})
+            for who in (ANON, AUTH):
+                with self.subTest(url=url, who=who):
+                    self.assertWithinBudget(3, who, 'post', url, {})
+
+
+def _route_names(patterns):
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= _route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def _planner_queries(url_name, query):
+    if (connection.vendor == 'postgresql' and url_name in COUNTED
+            and 'cursor=' not in query):
+        return 1
+    return 0
+
+
+def _format_queries(queries):
+    return '\n'.join(
+        f'{number}. {query["sql"]}'
+        for number, query in enumerate(queries, start=1))
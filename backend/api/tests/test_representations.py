@@ -0,0 +1,106 @@
+"""Представления рецептов из кэша."""
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.views import RecipesViewSet
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from users.models import User
+from .utils import FoodgramTestCase
+
+
+class RecipeRepresentationTest(APITestCase):
+    """Карточка рецепта при промахе кэша."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='Pa55w0rd!')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Блины', text='Смешать и испечь.',
+            cooking_time=10, image='images/recipe.gif')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recipe_deleted_before_reread(self):
+        get_object = RecipesViewSet.get_object
+
+        def get_and_delete(view):
+            # Рецепт удаляют между get_object() и чтением with_related().
+            recipe = get_object(view)
+            Recipe.objects.filter(pk=recipe.pk).delete()
+            return recipe
+
+        with mock.patch.object(
+                RecipesViewSet, 'get_object', get_and_delete):
+            response = self.client.get(
+                reverse('api:recipe-detail', kwargs={'pk': self.recipe.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_stats_need_shared_cache(self):
+        with self.assertRaises(CommandError):
+            call_command('recipe_cache_stats', stdout=StringIO())
+        url = reverse('api:recipe-detail', kwargs={'pk': self.recipe.pk})
+        self.client.get(url)
+        self.client.get(url)
+        out = StringIO()
+        with mock.patch(
+                'api.management.commands.recipe_cache_stats.'
+                'PROCESS_LOCAL_CACHES', ()):
+            call_command('recipe_cache_stats', reset=True, stdout=out)
+            self.assertEqual(
+                json.loads(out.getvalue()),
+                {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+            out = StringIO()
+            call_command('recipe_cache_stats', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['hits'], 0)
+
+
+class AdminIngredientLinesTest(FoodgramTestCase):
+    """Правка состава в админке видна в карточке рецепта и поиске."""
+
+    def test_change_and_delete_line(self):
+        recipe = self.create_recipe('Блины')
+        line = recipe.recipe_ingredients.first()
+        flour = Ingredient.objects.create(
+            name='мука', measurement_unit=self.units['г'])
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru',
+            password='Pa55w0rd!')
+        self.client.force_login(admin)
+        url = reverse('api:recipe-detail', kwargs={'pk': recipe.pk})
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('admin:recipes_recipeingredient_change',
+                        args=[line.pk]),
+                {'recipe': recipe.pk, 'ingredient': flour.pk, 'amount': 5})
+        self.assertIn(
+            (flour.pk, 5),
+            {(item['id'], item['amount'])
+             for item in self.client.get(url).json()['ingredients']})
+        response = self.client.get(
+            reverse('api:recipe-list'), {'search': 'мука'})
+        self.assertEqual(response.json()['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('admin:recipes_recipeingredient_delete',
+                        args=[line.pk]),
+                {'post': 'yes'})
+        self.assertFalse(RecipeIngredient.objects.filter(pk=line.pk).exists())
+        self.assertNotIn(
+            flour.pk,
+            {item['id'] for item
+             in self.client.get(url).json()['ingredients']})
+        response = self.client.get(
+            reverse('api:recipe-list'), {'search': 'мука'})
+        self.assertEqual(response.json()['count'], 0)
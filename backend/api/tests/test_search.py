@@ -0,0 +1,69 @@
+"""Поиск ингредиентов для автодополнения."""
+from unittest import mock
+
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from api import search
+from recipes.models import Ingredient, MeasurementUnit
+
+NAMES = (
+    'сахар',
+    'сахарная пудра',
+    'тростниковый сахар',
+    'сахорный сироп',
+    'сзаар',
+    'рафинированное масло',
+    'соль',
+)
+
+
+class FuzzyIngredientSearchTest(APITestCase):
+    """Порядок: начало названия, вхождение, опечатки по расстоянию."""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = MeasurementUnit.objects.resolve(('г',))['г']
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit) for name in NAMES)
+
+    def search(self, name):
+        response = self.client.get(
+            reverse('api:ingredient-list'), {'name': name, 'fuzzy': '1'})
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_then_contains_then_typos(self):
+        self.assertEqual(self.search('сахар'), [
+            'сахар',
+            'сахарная пудра',
+            'тростниковый сахар',
+            # Одна замена в более длинном слове выше двух правок.
+            'сахорный сироп',
+            'сзаар'])
+
+    def test_long_query_typos(self):
+        # Опечатка до и после FUZZY_MAX_PREFIX символов запроса.
+        for query in ('рафенированное', 'рафинированнае'):
+            self.assertEqual(self.search(query), ['рафинированное масло'])
+        # Три лишние буквы — дальше FUZZY_MAX_DISTANCE.
+        self.assertEqual(self.search('рафинированноееее'), [])
+
+    def test_short_query_prefix_only(self):
+        self.assertEqual(
+            self.search('са'), ['сахар', 'сахарная пудра', 'сахорный сироп'])
+        self.assertEqual(self.search('ах'), [])
+
+    def test_typo_candidates_are_capped(self):
+        unit = MeasurementUnit.objects.get(name='г')
+        letters = 'бвгдклмн'
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'сах{first}{second}', measurement_unit=unit)
+            for first in letters for second in letters)
+        with mock.patch.object(
+                search, '_prefix_distance',
+                wraps=search._prefix_distance) as prefix_distance:
+            # Пропуск буквы: «сахар» найден по самому запросу.
+            found = self.search('сахр')
+        self.assertEqual(found[0], 'сахар')
+        self.assertLessEqual(
+            prefix_distance.call_count, search.FUZZY_MAX_CANDIDATES)
@@ -0,0 +1,97 @@
+"""Суммы корзин и пакетные запросы к избранному и корзине."""
+from django.urls import reverse
+from rest_framework import status
+
+from recipes import counters, shopping_cart
+from recipes.models import ShoppingCartItem, ShoppingList
+from .utils import GIF_BASE64, FoodgramTestCase
+
+
+class ShoppingCartItemsTest(FoodgramTestCase):
+    """ShoppingCartItem совпадает с агрегатом после любых изменений."""
+
+    def test_items_follow_changes(self):
+        recipe = self.create_recipe()
+        cart_url = reverse(
+            'api:recipe-shopping-list', kwargs={'pk': recipe.pk})
+        self.client.post(cart_url)
+        ShoppingList.objects.create(user=self.author, recipe=recipe)
+        self.assertEqual(shopping_cart.differences(), {})
+        author_client = self.author_client()
+        response = author_client.patch(
+            reverse('api:recipe-detail', kwargs={'pk': recipe.pk}), {
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'image': GIF_BASE64,
+                'tags': [self.tags[0].pk],
+                'ingredients': [
+                    {'id': self.ingredients[0].pk, 'amount': 100},
+                    {'id': self.ingredients[-1].pk, 'amount': 7}]},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {(line['id'], line['amount'])
+             for line in response.data['ingredients']},
+            {(self.ingredients[0].pk, 100), (self.ingredients[-1].pk, 7)})
+        self.assertEqual(shopping_cart.differences(), {})
+        response = self.client.get(reverse('api:recipe-shopping-cart-summary'))
+        self.assertIn(
+            {'id': self.ingredients[-1].pk,
+             'name': self.ingredients[-1].name,
+             'measurement_unit': 'г',
+             'amount': 7}, response.json())
+        self.client.delete(cart_url)
+        self.assertEqual(shopping_cart.differences(), {})
+        author_client.delete(
+            reverse('api:recipe-detail', kwargs={'pk': recipe.pk}))
+        self.assertEqual(shopping_cart.differences(), {})
+        self.assertFalse(ShoppingCartItem.objects.exists())
+
+
+class BatchFavoriteShoppingCartTest(FoodgramTestCase):
+    """Пакетное добавление, удаление и очистка корзины."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = [
+            cls.create_recipe(f'Рецепт {number}').pk for number in range(3)]
+
+    def test_add_remove_and_errors(self):
+        missing = 10 ** 6
+        for url_name in ('recipe-favorite-batch',
+                         'recipe-shopping-cart-batch'):
+            url = reverse(f'api:{url_name}')
+            with self.subTest(url=url):
+                response = self.client.post(
+                    url, {'add': self.recipes + [missing]}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['added'], self.recipes)
+                self.assertEqual(
+                    response.data['errors'], {missing: 'Рецепт не найден.'})
+                response = self.client.post(url, {
+                    'add': self.recipes[:1], 'remove': self.recipes[1:]},
+                    format='json')
+                self.assertEqual(response.data['added'], [])
+                self.assertEqual(response.data['removed'], self.recipes[1:])
+                self.assertEqual(
+                    set(response.data['errors']), {self.recipes[0]})
+                self.assertEqual(shopping_cart.differences(), {})
+                self.assertEqual(set(counters.drift().values()), {0})
+        response = self.client.post(
+            reverse('api:recipe-favorite-batch'), {'add': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_clear_shopping_cart(self):
+        self.client.post(
+            reverse('api:recipe-shopping-cart-batch'),
+            {'add': self.recipes}, format='json')
+        self.assertTrue(ShoppingCartItem.objects.filter(user=self.user))
+        response = self.client.delete(
+            reverse('api:recipe-shopping-cart-summary'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(ShoppingList.objects.filter(user=self.user).exists())
+        self.assertFalse(
+            ShoppingCartItem.objects.filter(user=self.user).exists())
+        self.assertEqual(set(counters.drift().values()), {0})
@@ -0,0 +1,47 @@
+"""Версии кэшей без общего кэша: сброс из другого процесса."""
+from uuid import uuid4
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from recipes.models import CatalogVersion, Ingredient, MeasurementUnit, Tag
+from recipes.versions import INGREDIENTS, TAGS, bump_version, get_versions
+
+
+@override_settings(VERSIONS_IN_CACHE=False)
+class StoredVersionsTest(APITestCase):
+    """Версии в базе видны всем процессам, а не только сбросившему."""
+
+    def bump_elsewhere(self, name):
+        # Так сброс из manage.py выглядит для воркера: память процесса
+        # прежняя, меняется только строка в базе.
+        CatalogVersion.objects.filter(name=name).update(value=uuid4().hex)
+
+    def test_versions_stored_in_database(self):
+        versions = get_versions([TAGS, INGREDIENTS])
+        self.assertEqual(
+            dict(CatalogVersion.objects.values_list('name', 'value')),
+            versions)
+        bump_version(TAGS)
+        self.assertNotEqual(get_versions([TAGS])[TAGS], versions[TAGS])
+
+    def test_bump_from_other_process_reaches_responses(self):
+        url = reverse('api:ingredient-list')
+        unit = MeasurementUnit.objects.resolve(('г',))['г']
+        Ingredient.objects.create(name='мука', measurement_unit=unit)
+        self.assertEqual(len(self.client.get(url, {'name': 'ман'}).json()), 0)
+        # bulk_create сигналов не шлёт, как и загрузка в другом процессе.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='манка', measurement_unit=unit)])
+        self.assertEqual(len(self.client.get(url, {'name': 'ман'}).json()), 0)
+        self.bump_elsewhere(INGREDIENTS)
+        self.assertEqual(len(self.client.get(url, {'name': 'ман'}).json()), 1)
+
+        tags_url = reverse('api:tag-list')
+        etag = self.client.get(tags_url).headers['ETag']
+        Tag.objects.bulk_create([Tag(name='ужин', slug='dinner')])
+        self.bump_elsewhere(TAGS)
+        response = self.client.get(tags_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
@@ -0,0 +1,114 @@
+"""Общие данные и фабрики для тестов API."""
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from recipes.models import (Ingredient,
+                            MeasurementUnit,
+                            Recipe,
+                            RecipeIngredient,
+                            Tag)
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+GIF = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9'
+    b'\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02D\x01\x00;')
+GIF_BASE64 = (
+    'data:image/gif;base64,'
+    'R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+PNG_BASE64 = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+INGREDIENTS_COUNT = 10
+INGREDIENTS_PER_RECIPE = 3
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name,
+        email=f'{name}@foodgram.ru',
+        password='Pa55w0rd!',
+        first_name='Имя',
+        last_name='Фамилия')
+
+
+def create_recipe(author, tags, ingredients, name='Рецепт', amount=1):
+    recipe = Recipe(
+        author=author, name=name, text='Смешать и подать.', cooking_time=10)
+    recipe.image.save('recipe.gif', ContentFile(GIF), save=False)
+    recipe.save()
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient in ingredients)
+    return recipe
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_RENDITION_WORKERS=0)
+class FoodgramTestCase(APITestCase):
+    """Теги, ингредиенты, пользователь user и автор author.
+
+    Медиафайлы пишутся во временный каталог, кэш перед каждым тестом
+    пуст, self.client авторизован как user.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=name, slug=slug)
+            for name, slug in (('завтрак', 'breakfast'),
+                               ('обед', 'lunch'),
+                               ('ужин', 'dinner')))
+        cls.units = MeasurementUnit.objects.resolve(('г', 'кг', 'ч. л.'))
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'ингредиент {i}', measurement_unit=cls.units['г'])
+            for i in range(INGREDIENTS_COUNT))
+        cls.user = create_user('user')
+        cls.author = create_user('author')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def author_client(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        return client
+
+    @classmethod
+    def create_recipe(cls, name='Рецепт', amount=1):
+        return create_recipe(
+            cls.author, cls.tags,
+            cls.ingredients[:INGREDIENTS_PER_RECIPE], name, amount)
+
+    def recipe_payload(self):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': GIF_BASE64,
+            'tags': [tag.pk for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in self.ingredients[:INGREDIENTS_PER_RECIPE]],
+        }
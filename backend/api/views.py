@@ -1,46 +1,79 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Prefetch, Value, prefetch_related_objects
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.permissions import (AllowAny,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
+from api.exports import EXPORT_TYPES, export_shopping_cart
 from api.filters import IngredientFilter, RecipeFilter
 from api.pagination import CustomPagination
 from api.permissions import IsAuthorOrReadOnly
+from api.reference import ReferenceResponses
+from api.representations import recipe_representations
+from api.search import ingredient_index
 from api.serializers import (SignUpSerializer,
-                             UserSerializer,
+                             UserProfileSerializer,
                              AvatarSerializer,
                              ReadSubscriptionSerializer,
-                             SubscriptionSerializer,
                              TagSerializer,
                              IngredientSerializer,
+                             RecipeBatchSerializer,
                              RecipeWriteSerializer,
-                             FavoriteSerializer,
-                             ShoppingListSerializer)
-from api.utils import prepare_recipes_to_download
+                             ShortRecipeSerializer,
+                             ShoppingCartItemSerializer)
+from recipes import toggles
+from recipes.constants import INGREDIENT_SEARCH_LIMIT
 from recipes.models import (Favorite,
                             Ingredient,
                             Recipe,
-                            RecipeIngredient,
+                            ShoppingCartItem,
                             ShoppingList,
                             Tag)
+from recipes.versions import INGREDIENTS, TAGS
 from users.models import Subscription
 
 User = get_user_model()
 
+LIST_IMAGE = 'small'
+# Картинку можно прислать строкой base64 в JSON или файлом в multipart:
+# MultiPartParser читает тело кусками и пишет большие файлы на диск.
+IMAGE_PARSERS = (JSONParser, MultiPartParser, FormParser)
+ALREADY_ADDED = {
+    Favorite: 'Рецепт уже добавлен в Избранное.',
+    ShoppingList: 'Рецепт уже добавлен в Список покупок!',
+}
+RECIPE_NOT_FOUND = 'Рецепт не найден.'
+NOT_IN_LIST = 'Рецепта нет в списке.'
+
+tag_responses = ReferenceResponses(
+    TAGS,
+    lambda version: JSONRenderer().render(
+        TagSerializer(Tag.objects.all(), many=True).data))
+ingredient_responses = ReferenceResponses(
+    INGREDIENTS,
+    lambda version, name, fuzzy: ingredient_index.render(
+        name, INGREDIENT_SEARCH_LIMIT if name else None, fuzzy=fuzzy,
+        version=version))
+
 
 class UserViewSet(DjoserUserViewSet):
 
     queryset = User.objects.all()
     serializer_class = SignUpSerializer
     pagination_class = CustomPagination
+    # Ключ курсора для списков пользователей и подписок.
+    cursor_ordering = 'username'
 
     def get_serializer_class(self):
         if (
@@ -48,7 +81,7 @@ class UserViewSet(DjoserUserViewSet):
             or self.action == 'retrieve'
             or self.action == 'me'
         ):
-            return UserSerializer
+            return UserProfileSerializer
         return super().get_serializer_class()
 
     @action(
@@ -58,13 +91,15 @@ class UserViewSet(DjoserUserViewSet):
         detail=False,
     )
     def me(self, request):
-        serializer = UserSerializer(request.user, context={'request': request})
+        serializer = UserProfileSerializer(
+            request.user, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         methods=['PUT', 'DELETE'],
         url_path='me/avatar',
         permission_classes=(IsAuthenticated,),
+        parser_classes=IMAGE_PARSERS,
         detail=False,
     )
     def avatar(self, request):
@@ -74,7 +109,10 @@ class UserViewSet(DjoserUserViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
-        request.user.avatar.delete()
+        # Файл может быть и у других пользователей (recipes.storage);
+        # ненужные файлы убирает collect_media_garbage.
+        request.user.avatar = None
+        request.user.save(update_fields=('avatar',))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -84,13 +122,23 @@ class UserViewSet(DjoserUserViewSet):
         detail=False,
     )
     def get_subscribtions(self, request):
-        user = get_object_or_404(User, username=request.user.username)
-        limit = request.query_params.get('limit')
-        following_users = User.objects.filter(following__subscriber=user)
-        if limit:
-            following_users = following_users[:int(limit)]
+        following_users = User.objects.filter(
+            following__subscriber=request.user
+        ).annotate(
+            is_subscribed=Value(True)
+        ).order_by('username')
         paginator = CustomPagination()
-        result_page = paginator.paginate_queryset(following_users, request)
+        result_page = paginator.paginate_queryset(
+            following_users, request, view=self)
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'image_renditions', 'cooking_time',
+            'author')
+        recipes_limit = request.query_params.get('recipes_limit', '')
+        if recipes_limit.isdigit():
+            recipes = recipes.limited_per_author(int(recipes_limit))
+        prefetch_related_objects(
+            result_page,
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes'))
         serializer = ReadSubscriptionSerializer(
             result_page,
             many=True,
@@ -103,22 +151,32 @@ class UserViewSet(DjoserUserViewSet):
         permission_classes=(IsAuthenticated,),
         detail=True,
     )
+    @transaction.atomic
     def subscribe(self, request, id):
-        user = get_object_or_404(User, username=request.user.username)
-        following = get_object_or_404(User, pk=id)
         if request.method == 'POST':
-            serializer = SubscriptionSerializer(
-                data={'subscriber': user.id, 'author': following.id},
-                context={'request': request}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            following = get_object_or_404(User, pk=id)
+            if following.pk == request.user.pk:
+                return Response(
+                    {'non_field_errors': ['Нельзя подписаться на себя.']},
+                    status=status.HTTP_400_BAD_REQUEST)
+            if not toggles.add(
+                Subscription,
+                subscriber_id=request.user.pk,
+                author_id=following.pk
+            ):
+                return Response(
+                    {'non_field_errors': ['Вы уже подписаны.']},
+                    status=status.HTTP_400_BAD_REQUEST)
+            # Счётчик в базе уже увеличен, объект прочитан до этого.
+            following.followers_count += 1
+            serializer = ReadSubscriptionSerializer(
+                following, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        follow = Subscription.objects.filter(
-            subscriber=user.id, author=following.id)
-        if follow:
-            follow.delete()
+        if toggles.remove(
+            Subscription, subscriber_id=request.user.pk, author_id=id
+        ):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, pk=id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -127,15 +185,29 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    # Справочник общий для всех, токен не нужен и не проверяется.
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def list(self, request, *args, **kwargs):
+        return tag_responses.respond(request)
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
 
-    queryset = Ingredient.objects.all()
+    queryset = Ingredient.objects.select_related('measurement_unit')
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def list(self, request, *args, **kwargs):
+        return ingredient_responses.respond(
+            request,
+            request.query_params.get('name', ''),
+            request.query_params.get('fuzzy') in ('1', 'true'))
 
 
 class RecipesViewSet(viewsets.ModelViewSet):
@@ -144,8 +216,38 @@ class RecipesViewSet(viewsets.ModelViewSet):
     serializer_class = RecipeWriteSerializer
     pagination_class = CustomPagination
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
+    parser_classes = IMAGE_PARSERS
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    # В режиме курсора порядок всегда по новизне, в том числе при поиске.
+    cursor_ordering = '-id'
+
+    def get_queryset(self):
+        queryset = Recipe.objects.with_user_flags(self.request.user)
+        if self.action in ('list', 'retrieve'):
+            # Остальные поля берутся из кэша представлений, счётчики
+            # меняются чаще рецепта и накладываются из строки.
+            return queryset.only(
+                'id', 'author_id', 'favorites_count', 'shopping_carts_count')
+        return queryset.with_related()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        # Карточкам в списке хватает маленькой копии картинки.
+        if page is not None:
+            return self.get_paginated_response(
+                recipe_representations.render(page, request, LIST_IMAGE))
+        return Response(recipe_representations.render(
+            list(queryset), request, LIST_IMAGE))
+
+    def retrieve(self, request, *args, **kwargs):
+        representations = recipe_representations.render(
+            [self.get_object()], request)
+        # При промахе кэша рецепт перечитывается и мог быть уже удалён.
+        if not representations:
+            raise Http404
+        return Response(representations[0])
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -158,7 +260,6 @@ class RecipesViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, pk):
         return self.add_to_favorite_or_shopping_list(
-            serializer=FavoriteSerializer,
             model=Favorite,
             id=pk,
             request=request)
@@ -171,11 +272,56 @@ class RecipesViewSet(viewsets.ModelViewSet):
     )
     def shopping_list(self, request, pk):
         return self.add_to_favorite_or_shopping_list(
-            serializer=ShoppingListSerializer,
             model=ShoppingList,
             id=pk,
             request=request)
 
+    @action(
+        methods=['POST'],
+        url_path='favorite/batch',
+        url_name='favorite-batch',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, request):
+        """Добавление и удаление нескольких рецептов в избранном."""
+        return self.batch_favorite_or_shopping_list(Favorite, request)
+
+    @action(
+        methods=['POST'],
+        url_path='shopping_cart/batch',
+        url_name='shopping-cart-batch',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request):
+        """Добавление и удаление нескольких рецептов в корзине."""
+        return self.batch_favorite_or_shopping_list(ShoppingList, request)
+
+    @action(
+        methods=['GET'],
+        url_path='shopping_cart',
+        url_name='shopping-cart-summary',
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_summary(self, request):
+        """Общее количество каждого ингредиента в корзине."""
+
+        items = ShoppingCartItem.objects.filter(
+            user=request.user
+        ).select_related(
+            'ingredient__measurement_unit'
+        ).order_by('ingredient__name')
+        return Response(ShoppingCartItemSerializer(items, many=True).data)
+
+    @shopping_cart_summary.mapping.delete
+    @transaction.atomic
+    def clear_shopping_cart(self, request):
+        """Очистка корзины."""
+        toggles.clear(ShoppingList, request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         methods=['GET'],
         url_path='download_shopping_cart',
@@ -183,43 +329,59 @@ class RecipesViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def make_shopping_list(self, request):
-        shopping_cart_ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__shopping_list__user=request.user
-            ).values(
-                'ingredient__name',
-                'ingredient__measurement_unit'
-            ).annotate(total_amount=Sum('amount')).order_by('ingredient__name')
-        )
-        shopping_list = prepare_recipes_to_download(shopping_cart_ingredients)
-        return self.download_shopping_list(shopping_list)
-
-    def download_shopping_list(self, shopping_list_text):
-        response = HttpResponse(shopping_list_text, content_type='text/plain')
-        response[
-            'Content-Disposition'
-        ] = 'attachment; filename="shopping_list.txt"'
-        return response
-
-    def add_to_favorite_or_shopping_list(
-            self, id, model, serializer, request,
-    ):
-        recipe = get_object_or_404(Recipe, id=id)
-        if request.method == 'POST':
-            serializer = serializer(data={
-                'recipe': recipe.id,
-                'user': request.user.id,
-                'context': {'request': request}})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        recipe = model.objects.filter(user=request.user, recipe=recipe)
-        if not recipe:
+        export_type = request.query_params.get('type', 'txt')
+        if export_type not in EXPORT_TYPES:
             return Response(
-                {'error': 'Рецепт не найден'},
+                {'type': f'Доступные форматы: {", ".join(EXPORT_TYPES)}.'},
                 status=status.HTTP_400_BAD_REQUEST)
-        recipe.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return export_shopping_cart(request, export_type)
+
+    @transaction.atomic
+    def add_to_favorite_or_shopping_list(self, id, model, request):
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=id)
+            if not toggles.add(
+                model, user_id=request.user.pk, recipe_id=recipe.pk
+            ):
+                return Response(
+                    {'non_field_errors': [ALREADY_ADDED[model]]},
+                    status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                ShortRecipeSerializer(recipe).data,
+                status=status.HTTP_201_CREATED)
+        if toggles.remove(model, user_id=request.user.pk, recipe_id=id):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, id=id)
+        return Response(
+            {'error': 'Рецепт не найден'},
+            status=status.HTTP_400_BAD_REQUEST)
+
+    @transaction.atomic
+    def batch_favorite_or_shopping_list(self, model, request):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add = serializer.validated_data['add']
+        remove = serializer.validated_data['remove']
+        added = set(toggles.add_many(model, request.user.pk, add))
+        removed = set(toggles.remove_many(model, request.user.pk, remove))
+        errors = {}
+        failed = [pk for pk in add if pk not in added] + [
+            pk for pk in remove if pk not in removed]
+        if failed:
+            # Причину отказа ищем одним запросом и только для отказов.
+            existing = set(Recipe.objects.filter(
+                pk__in=failed).values_list('pk', flat=True))
+            for pk in failed:
+                if pk not in existing:
+                    errors[pk] = RECIPE_NOT_FOUND
+                elif pk in add:
+                    errors[pk] = ALREADY_ADDED[model]
+                else:
+                    errors[pk] = NOT_IN_LIST
+        return Response({
+            'added': [pk for pk in add if pk in added],
+            'removed': [pk for pk in remove if pk in removed],
+            'errors': errors})
 
     @action(
         methods=['GET'],
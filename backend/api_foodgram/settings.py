@@ -84,6 +84,29 @@ else:
     }
 
 
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+            },
+        }
+    }
+
+# Версии кэшей (recipes.versions) хранятся в кэше, только если он общий
+# для всех процессов; иначе — в базе, чтобы их сброс из manage.py видели
+# воркеры gunicorn.
+VERSIONS_IN_CACHE = bool(os.getenv('REDIS_URL'))
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -149,6 +172,26 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+STORAGES = {
+    # Файлы называются по хэшу содержимого, см. recipes.storage.
+    'default': {
+        'BACKEND': 'recipes.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Файлы больше этого размера (и картинки из base64 больше него) пишутся
+# во временный файл кусками, а не держатся в памяти воркера.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+# Выгрузки списка покупок отдаёт nginx по X-Accel-Redirect из EXPORT_ROOT
+# (location /protected/exports/ в nginx.conf), Django только пишет файл.
+EXPORT_ACCEL_REDIRECT = (
+    os.getenv('EXPORT_ACCEL_REDIRECT', 'False').lower() == 'true')
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', os.path.join(BASE_DIR, 'exports'))
+EXPORT_ACCEL_URL = '/protected/exports/'
+# Процессов для сборки уменьшенных копий картинок; 0 — в самом запросе.
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
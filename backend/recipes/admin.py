@@ -1,11 +1,24 @@
 from django.contrib import admin
+from django.db import transaction
 
+from . import counters, shopping_cart
+from .fulltext import refresh_search_index
 from .models import (Tag,
                      Ingredient,
+                     MeasurementUnit,
                      Recipe,
                      RecipeIngredient,
                      Favorite,
                      ShoppingList)
+from .versions import CARTS, RECIPES, bump_versions, item
+
+
+@admin.register(MeasurementUnit)
+class MeasurementUnitAdmin(admin.ModelAdmin):
+
+    list_display = ('name', 'base', 'factor')
+    list_select_related = ('base',)
+    search_fields = ('name',)
 
 
 @admin.register(Ingredient)
@@ -13,12 +26,22 @@ class IngredientAdmin(admin.ModelAdmin):
 
     list_display = ('id', 'name', 'measurement_unit')
     list_editable = ('name', 'measurement_unit')
+    list_select_related = ('measurement_unit',)
     search_fields = ('name',)
     list_filter = ('name',)
 
 
+class CountedLinkAdmin(admin.ModelAdmin):
+    """Правка связи переносит хранимые счётчики на новых владельцев."""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            counters.link_moved(obj, form.initial)
+
+
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(CountedLinkAdmin):
 
     list_display = ('name', 'author')
     search_fields = ('name', 'author__username')
@@ -27,10 +50,56 @@ class RecipeAdmin(admin.ModelAdmin):
 
     @admin.display(description='Число добавлений рецепта в избранное.')
     def added_to_favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
+
+
+@admin.register(RecipeIngredient)
+class RecipeIngredientAdmin(admin.ModelAdmin):
+    """Правки состава обновляют рецепт: корзины с ним, кэш и поиск."""
+
+    list_display = ('recipe', 'ingredient', 'amount')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.recipes_changed({obj.recipe_id, form.initial.get('recipe')})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recipes_changed({obj.recipe_id})
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.recipes_changed(recipe_ids)
+
+    def recipes_changed(self, recipe_ids):
+        recipe_ids = recipe_ids - {None}
+        user_ids = shopping_cart.rebuild_recipe_carts(recipe_ids)
+        transaction.on_commit(lambda: refresh_search_index(recipe_ids))
+        transaction.on_commit(lambda: bump_versions(
+            [item(RECIPES, recipe_id) for recipe_id in recipe_ids]
+            + [item(CARTS, user_id) for user_id in user_ids]))
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(CountedLinkAdmin):
+
+    list_display = ('user', 'recipe')
+
+
+@admin.register(ShoppingList)
+class ShoppingListAdmin(CountedLinkAdmin):
+    """Перенос рецепта в другую корзину пересобирает обе корзины."""
+
+    list_display = ('user', 'recipe')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            user_ids = {obj.user_id, form.initial.get('user')} - {None}
+            shopping_cart.rebuild(user_ids)
+            transaction.on_commit(lambda: bump_versions(
+                item(CARTS, user_id) for user_id in user_ids))
 
 
 admin.site.register(Tag)
-admin.site.register(RecipeIngredient)
-admin.site.register(Favorite)
-admin.site.register(ShoppingList)
@@ -5,3 +5,17 @@ MEASUREMENT_MAX_LENGTH = 64
 RECIPE_NAME_MAX_LENGTH = 256
 COOKING_MIN_TIME = 1
 SHORT_LINK_MAX_LENGTH = 255
+INGREDIENT_SEARCH_LIMIT = 50
+VERSION_NAME_MAX_LENGTH = 64
+VERSION_VALUE_MAX_LENGTH = 32
+# Рецептов в одном пакетном запросе к избранному или корзине.
+RECIPE_BATCH_MAX_SIZE = 100
+# Единица -> (базовая единица, сколько базовых в одной). Кухонные меры
+# объёма переведены по ГОСТ-овским 5 и 15 мл и гранёному стакану.
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+    'ч. л.': ('мл', 5),
+    'ст. л.': ('мл', 15),
+    'стакан': ('мл', 200),
+}
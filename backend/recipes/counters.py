@@ -0,0 +1,121 @@
+"""Хранимые счётчики рецептов и пользователей.
+
+Создание и удаление связи (избранное, корзина, подписка, рецепт автора)
+меняет счётчик владельца выражением F() в той же транзакции, что и
+сама запись: представления API оборачивают её в transaction.atomic,
+каскадное удаление атомарно само. Массовые вставки сигналов не шлют,
+поэтому после них, а также для починки расхождений есть reconcile.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Subscription, User
+from .models import Favorite, Recipe, ShoppingList
+
+# (модель со счётчиком, поле счётчика, модель связи, FK на владельца)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+    (User, 'following_count', Subscription, 'subscriber'),
+)
+
+
+def link_added(link):
+    for owner, counter, _, field in _counters(link):
+        _update(owner, counter, getattr(link, f'{field}_id'), 1)
+
+
+def link_removed(link, origin=None):
+    """Связь удалена; origin — объект, с которого начато удаление."""
+    for owner, counter, _, field in _counters(link):
+        pk = getattr(link, f'{field}_id')
+        # Владелец удаляется сам: счётчик удалённой строки не нужен.
+        if not (isinstance(origin, owner) and origin.pk == pk):
+            _update(owner, counter, pk, -1)
+
+
+def links_added(links):
+    """Пачка связей одной модели добавлена (пакетные эндпоинты)."""
+    _update_many(links, 1)
+
+
+def links_removed(links):
+    _update_many(links, -1)
+
+
+def link_moved(link, old_owners):
+    """Связь перенесли на других владельцев (правка в админке).
+
+    old_owners — {FK: прежний id} из исходных данных формы.
+    """
+    for owner, counter, model, field in _counters(link):
+        old_id = old_owners.get(field)
+        new_id = getattr(link, f'{field}_id')
+        if old_id is not None and old_id != new_id:
+            _update(owner, counter, old_id, -1)
+            _update(owner, counter, new_id, 1)
+
+
+def drift():
+    """Число строк с разошедшимся счётчиком {'Модель.поле': строк}."""
+    return {
+        f'{owner.__name__}.{counter}': _mismatched(
+            owner, counter, model, field).count()
+        for owner, counter, model, field in COUNTERS}
+
+
+def reconcile():
+    """Пересчитывает разошедшиеся счётчики, возвращает их число."""
+    return {
+        f'{owner.__name__}.{counter}': owner.objects.filter(
+            pk__in=_mismatched(
+                owner, counter, model, field).values('pk')
+        ).update(**{counter: _actual(model, field)})
+        for owner, counter, model, field in COUNTERS}
+
+
+def _counters(link):
+    return [
+        (owner, counter, model, field)
+        for owner, counter, model, field in COUNTERS
+        if isinstance(link, model)]
+
+
+def _update(owner, counter, pk, delta):
+    # Greatest: уже разошедшийся счётчик не уходит в минус и не ломает
+    # удаление проверкой PositiveIntegerField.
+    owner.objects.filter(pk=pk).update(
+        **{counter: Greatest(F(counter) + delta, 0)})
+
+
+def _update_many(links, sign):
+    # Одно UPDATE на каждое различное приращение, обычно одно на счётчик.
+    if not links:
+        return
+    for owner, counter, _, field in _counters(links[0]):
+        by_delta = defaultdict(list)
+        for pk, count in Counter(
+                getattr(link, f'{field}_id') for link in links).items():
+            by_delta[count * sign].append(pk)
+        for delta, pks in by_delta.items():
+            owner.objects.filter(pk__in=pks).update(
+                **{counter: Greatest(F(counter) + delta, 0)})
+
+
+def _actual(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')), 0)
+
+
+def _mismatched(owner, counter, model, field):
+    return owner.objects.annotate(
+        actual=_actual(model, field)
+    ).exclude(**{counter: F('actual')})
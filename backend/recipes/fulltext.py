@@ -0,0 +1,126 @@
+"""Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+На PostgreSQL в recipes_recipe хранится колонка search_vector типа
+tsvector с GIN-индексом, на SQLite — таблица FTS5 recipes_recipe_fts,
+rowid которой совпадает с id рецепта. Обе структуры создаёт миграция
+0013 (со своей копией SQL) и обновляет refresh_search_index после
+изменения рецепта.
+"""
+import re
+
+from django.db import NotSupportedError, connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса совпадений в названии, ингредиентах и описании для bm25 в SQLite.
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+INGREDIENT_NAMES_SQL = (
+    "SELECT {aggregate} FROM recipes_recipeingredient ri "
+    "JOIN recipes_ingredient i ON i.id = ri.ingredient_id "
+    "WHERE ri.recipe_id = r.id")
+
+
+def refresh_search_index(recipe_ids=None, using=connection):
+    """Пересчитывает поисковые данные рецептов recipe_ids (или всех)."""
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+    _by_vendor(using.vendor, _refresh_postgresql, _refresh_sqlite)(
+        using, recipe_ids)
+
+
+def delete_from_search_index(recipe_ids, using=connection):
+    """Убирает удалённые рецепты из FTS5; tsvector удаляется со строкой."""
+    if using.vendor == 'sqlite':
+        with using.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+                f'({", ".join(["%s"] * len(recipe_ids))})', recipe_ids)
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под query, от более релевантных к менее."""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return queryset
+    return _by_vendor(connection.vendor, _search_postgresql, _search_sqlite)(
+        queryset, terms).order_by('-search_rank', '-id')
+
+
+def _search_postgresql(queryset, terms):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    return queryset.annotate(
+        search_match=RawSQL(
+            f"recipes_recipe.search_vector @@ "
+            f"to_tsquery('{SEARCH_CONFIG}', %s)",
+            (tsquery,), output_field=BooleanField()),
+        search_rank=RawSQL(
+            f"ts_rank_cd(recipes_recipe.search_vector, "
+            f"to_tsquery('{SEARCH_CONFIG}', %s))",
+            (tsquery,), output_field=FloatField()),
+    ).filter(search_match=True)
+
+
+def _search_sqlite(queryset, terms):
+    # Ранг bm25 доступен только в запросе с MATCH по самой FTS5-таблице.
+    # LIMIT -1 не даёт SQLite развернуть внутренний подзапрос в
+    # коррелированный: MATCH выполняется один раз, а ранг строки
+    # находится по автоматическому индексу, а не новым поиском.
+    weights = ', '.join(map(str, FTS_WEIGHTS))
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match,),
+    )).annotate(search_rank=RawSQL(
+        f'SELECT ranks.value FROM ('
+        f'SELECT rowid AS id, -bm25({FTS_TABLE}, {weights}) AS value '
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT -1'
+        f') AS ranks WHERE ranks.id = recipes_recipe.id',
+        (match,), output_field=FloatField()))
+
+
+def _refresh_postgresql(using, recipe_ids):
+    names = INGREDIENT_NAMES_SQL.format(aggregate="string_agg(i.name, ' ')")
+    sql = (
+        f"UPDATE recipes_recipe AS r SET search_vector = "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', r.name), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+        f"coalesce(({names}), '')), 'B') || "
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', r.text), 'C')")
+    with using.cursor() as cursor:
+        if recipe_ids is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(f'{sql} WHERE r.id = ANY(%s)', (recipe_ids,))
+
+
+def _refresh_sqlite(using, recipe_ids):
+    names = INGREDIENT_NAMES_SQL.format(aggregate="group_concat(i.name, ' ')")
+    insert = (
+        f"INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) "
+        f"SELECT r.id, r.name, coalesce(({names}), ''), r.text "
+        f"FROM recipes_recipe r")
+    with using.cursor() as cursor:
+        if recipe_ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(insert)
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids)
+        cursor.execute(
+            f'{insert} WHERE r.id IN ({placeholders})', recipe_ids)
+
+
+def _by_vendor(vendor, postgresql, sqlite):
+    if vendor == 'postgresql':
+        return postgresql
+    if vendor == 'sqlite':
+        return sqlite
+    raise NotSupportedError(
+        f'Полнотекстовый поиск не поддерживается для {vendor}.')
@@ -0,0 +1,82 @@
+"""Уменьшенные копии картинок; выполняется в дочерних процессах.
+
+Модуль не импортирует Django: процессы пула запускаются через spawn и
+получают путь к исходнику (или его байты), а возвращают байты копий.
+"""
+import base64
+import binascii
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Формат -> (формат Pillow, параметры сохранения).
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# Фон для прозрачных картинок в JPEG.
+BACKGROUND = (255, 255, 255)
+# Форматы Pillow, принимаемые при импорте, -> расширение файла.
+DECODED_EXTENSIONS = {
+    'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def decode(data):
+    """(расширение, байты) картинки из строки data:image/...;base64.
+
+    Картинка проверяется Pillow без полного декодирования; при ошибке
+    поднимается ValueError с текстом для отчёта.
+    """
+    if not isinstance(data, str) or not data.startswith('data:image'):
+        raise ValueError('Ожидается строка data:image/...;base64.')
+    _, _, encoded = data.partition(';base64,')
+    try:
+        content = base64.b64decode(encoded, validate=True)
+    except binascii.Error:
+        raise ValueError('Некорректный base64.')
+    try:
+        with Image.open(BytesIO(content)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:
+        raise ValueError('Загрузите корректное изображение.')
+    if image_format not in DECODED_EXTENSIONS:
+        raise ValueError(f'Формат {image_format} не поддерживается.')
+    return DECODED_EXTENSIONS[image_format], content
+
+
+def render(source, sizes):
+    """{размер: {формат: байты}} для картинки source — пути или байтов.
+
+    sizes — {размер: наибольшая сторона в пикселях}; картинки меньше
+    этой стороны не увеличиваются.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    with Image.open(source) as source:
+        # Для JPEG декодер сразу уменьшает картинку кратно 1/2..1/8.
+        largest = max(sizes.values())
+        source.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info
+                or image.mode in ('LA', 'PA') else 'RGB')
+        renditions = {}
+        for size, side in sizes.items():
+            copy = image.copy()
+            copy.thumbnail((side, side), Image.Resampling.LANCZOS)
+            renditions[size] = {
+                name: _encode(copy, name) for name in FORMATS}
+        return renditions
+
+
+def _encode(image, name):
+    pil_format, options = FORMATS[name]
+    if pil_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
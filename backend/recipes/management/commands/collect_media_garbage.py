@@ -0,0 +1,102 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import renditions
+
+
+class Command(BaseCommand):
+    """Удаление картинок, на которые не ссылается ни одна строка."""
+
+    help = (
+        'Обходит каталоги картинок рецептов и аватаров в несколько потоков '
+        '(по подкаталогу на задачу) и удаляет файлы, на которые не '
+        'ссылаются ни картинки, ни их текущие копии. Файлы моложе '
+        '--min-age минут не трогаются: их строки могут быть ещё не '
+        'сохранены. С --check только считает такие файлы и завершается '
+        'ошибкой, если они есть.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--min-age', type=int, default=60)
+
+    def handle(self, *args, **options):
+        referenced = self.referenced()
+        scan = partial(
+            self.scan, referenced,
+            time.time() - options['min_age'] * 60, options['check'])
+        files = size = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for found, found_size in executor.map(scan, self.roots()):
+                files += found
+                size += found_size
+        summary = f'файлов {files}, {size / 2 ** 20:.1f} МБ'
+        if options['check']:
+            if files:
+                raise CommandError(f'Картинки без ссылок: {summary}.')
+            self.stdout.write(self.style.SUCCESS('Картинок без ссылок нет.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Удалено: {summary}.'))
+
+    def referenced(self):
+        """Имена картинок и их текущих копий во всех строках."""
+        names = set()
+        for model, (field, _) in renditions.FIELDS.items():
+            for name, current in model.objects.exclude(
+                **{field: ''}
+            ).exclude(
+                **{f'{field}__isnull': True}
+            ).values_list(field, f'{field}_renditions').iterator():
+                names.add(name)
+                # Копии прежней картинки больше не нужны.
+                if current.get('source') == name:
+                    names.update(
+                        path for formats in current['sizes'].values()
+                        for path in formats.values())
+        return names
+
+    def roots(self):
+        """(каталог, обходить ли вглубь) — задачи для потоков."""
+        for model, (field, _) in renditions.FIELDS.items():
+            top = default_storage.path(
+                model._meta.get_field(field).upload_to)
+            if not os.path.isdir(top):
+                continue
+            # Файлы прежней плоской раскладки лежат прямо в каталоге.
+            yield top, False
+            with os.scandir(top) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield entry.path, True
+
+    def scan(self, referenced, cutoff, check, root):
+        """Число и размер файлов без ссылок в root; удаляет их без check."""
+        directory, recursive = root
+        files = size = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        found, found_size = self.scan(
+                            referenced, cutoff, check, (entry.path, True))
+                        files += found
+                        size += found_size
+                    continue
+                name = os.path.relpath(
+                    entry.path, default_storage.location).replace(os.sep, '/')
+                stat = entry.stat(follow_symlinks=False)
+                if name in referenced or stat.st_mtime > cutoff:
+                    continue
+                files += 1
+                size += stat.st_size
+                if not check:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+        return files, size
@@ -0,0 +1,235 @@
+import json
+import random
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from multiprocessing import get_context
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from api_foodgram.settings import PATH_TO_INGREDIENTS, PATH_TO_TAGS
+from recipes import counters, shopping_cart
+from recipes.constants import RECIPE_NAME_MAX_LENGTH
+from recipes.fulltext import refresh_search_index
+from recipes.models import (Favorite,
+                            Ingredient,
+                            MeasurementUnit,
+                            Recipe,
+                            RecipeIngredient,
+                            ShoppingList,
+                            Tag)
+from recipes.versions import INGREDIENTS, TAGS, bump_version
+from users.models import Subscription, User
+
+PLACEHOLDER_IMAGE = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9'
+    b'\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02D\x01\x00;')
+PLACEHOLDER_NAME = 'images/dataset_placeholder.gif'
+
+# Состояние, которое родительский процесс готовит до fork и которое
+# дочерние процессы получают без сериализации.
+_shared = {}
+
+
+class Command(BaseCommand):
+    """Генерация синтетического набора данных для нагрузочных тестов."""
+
+    help = (
+        'Создаёт пользователей, рецепты с ингредиентами из '
+        'data/ingredients.json, теги, избранное, корзины и граф подписок '
+        'со степенным распределением популярности авторов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes-per-user', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int, default=10)
+        parser.add_argument(
+            '--alpha', type=float, default=1.2,
+            help='Показатель степени для популярности авторов.')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and workers > 1:
+            self.stdout.write('SQLite не допускает параллельной записи, '
+                              'генерация идёт в одном процессе.')
+            workers = 1
+        seed = options['seed']
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        _shared.update(
+            options=options,
+            seed=seed,
+            tag_ids=self.ensure_tags(),
+            ingredients=self.ensure_ingredients(),
+            image=self.ensure_image())
+
+        prefix = f'bench_{uuid.uuid4().hex[:8]}_'
+        user_ids = self.create_users(prefix, options)
+        _shared['user_ids'] = user_ids
+        self.run(workers, _create_recipes, user_ids, options['batch_size'])
+        recipe_ids = list(Recipe.objects.filter(
+            author__username__startswith=prefix
+        ).values_list('id', flat=True))
+        _shared['recipe_ids'] = recipe_ids
+        self.run(workers, _create_relations, user_ids, options['batch_size'])
+        # bulk_create не шлёт сигналов, счётчики пересчитываются разом.
+        counters.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, рецептов: '
+            f'{len(recipe_ids)} (префикс {prefix}, seed {seed}).'))
+
+    def run(self, workers, task, user_ids, batch_size):
+        """Делит пользователей на пачки и обрабатывает их в workers."""
+        step = max(1, batch_size // 10)
+        chunks = [
+            user_ids[start:start + step]
+            for start in range(0, len(user_ids), step)]
+        if workers == 1:
+            for chunk in chunks:
+                task(chunk)
+            return
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context('fork')
+        ) as executor:
+            list(executor.map(task, chunks))
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            with open(PATH_TO_TAGS, encoding='UTF-8') as tag_file:
+                Tag.objects.bulk_create(
+                    Tag(**tag) for tag in json.load(tag_file))
+            bump_version(TAGS)
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def ensure_ingredients(self):
+        if not Ingredient.objects.exists():
+            with open(PATH_TO_INGREDIENTS, encoding='UTF-8') as file:
+                ingredients = json.load(file)
+            units = MeasurementUnit.objects.resolve(
+                ingredient['measurement_unit'] for ingredient in ingredients)
+            Ingredient.objects.bulk_create(
+                Ingredient(
+                    name=ingredient['name'],
+                    measurement_unit=units[ingredient['measurement_unit']])
+                for ingredient in ingredients)
+            bump_version(INGREDIENTS)
+        return dict(Ingredient.objects.values_list('id', 'name'))
+
+    def ensure_image(self):
+        # Хранилище адресует файлы по содержимому: картинка сохранится
+        # один раз, сколько бы наборов ни создавалось.
+        return default_storage.save(
+            PLACEHOLDER_NAME, ContentFile(PLACEHOLDER_IMAGE))
+
+    def create_users(self, prefix, options):
+        password = make_password(None)
+        User.objects.bulk_create(
+            (User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name='Тест',
+                last_name=f'Пользователь {number}',
+                password=password)
+             for number in range(options['users'])),
+            batch_size=options['batch_size'])
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+
+def _random(chunk):
+    return random.Random(f'{_shared["seed"]}-{chunk[0]}')
+
+
+def _create_recipes(user_ids):
+    options = _shared['options']
+    rng = _random(user_ids)
+    tag_ids = _shared['tag_ids']
+    ingredients = _shared['ingredients']
+    ingredient_ids = list(ingredients)
+    per_recipe = min(options['ingredients_per_recipe'], len(ingredient_ids))
+    tags_per_recipe = min(options['tags_per_recipe'], len(tag_ids))
+    compositions = [
+        rng.sample(ingredient_ids, per_recipe)
+        for _ in range(len(user_ids) * options['recipes_per_user'])]
+    with transaction.atomic():
+        recipes = Recipe.objects.bulk_create(
+            (_recipe(user_id, composition, ingredients, rng)
+             for user_id, composition in zip(
+                 (user_id for user_id in user_ids
+                  for _ in range(options['recipes_per_user'])),
+                 compositions)),
+            batch_size=options['batch_size'])
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+             for recipe in recipes
+             for tag_id in rng.sample(tag_ids, tags_per_recipe)),
+            batch_size=options['batch_size'])
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500))
+             for recipe, composition in zip(recipes, compositions)
+             for ingredient_id in composition),
+            batch_size=options['batch_size'])
+        refresh_search_index(recipe.id for recipe in recipes)
+
+
+def _recipe(user_id, composition, ingredients, rng):
+    names = [ingredients[ingredient_id] for ingredient_id in composition]
+    cooking_time = rng.randint(5, 180)
+    return Recipe(
+        author_id=user_id,
+        name=f'{names[0].capitalize()} с {names[-1]}'[:RECIPE_NAME_MAX_LENGTH],
+        text=(f'Смешайте {", ".join(names)}. '
+              f'Готовьте {cooking_time} минут и подавайте горячим.'),
+        cooking_time=cooking_time,
+        image=_shared['image'])
+
+
+def _create_relations(user_ids):
+    options = _shared['options']
+    rng = _random(user_ids)
+    recipe_ids = _shared['recipe_ids']
+    authors = _shared['user_ids']
+    popularity = list(accumulate(
+        1 / rank ** options['alpha'] for rank in range(1, len(authors) + 1)))
+    favorites = min(options['favorites_per_user'], len(recipe_ids))
+    carts = min(options['carts_per_user'], len(recipe_ids))
+    with transaction.atomic():
+        Favorite.objects.bulk_create(
+            (Favorite(user_id=user_id, recipe_id=recipe_id)
+             for user_id in user_ids
+             for recipe_id in rng.sample(recipe_ids, favorites)),
+            batch_size=options['batch_size'], ignore_conflicts=True)
+        ShoppingList.objects.bulk_create(
+            (ShoppingList(user_id=user_id, recipe_id=recipe_id)
+             for user_id in user_ids
+             for recipe_id in rng.sample(recipe_ids, carts)),
+            batch_size=options['batch_size'], ignore_conflicts=True)
+        # bulk_create не шлёт сигналов, суммы корзин собираются отдельно.
+        shopping_cart.rebuild(user_ids, batch_size=options['batch_size'])
+        Subscription.objects.bulk_create(
+            (Subscription(subscriber_id=user_id, author_id=author_id)
+             for user_id in user_ids
+             for author_id in set(rng.choices(
+                 authors, cum_weights=popularity,
+                 k=options['subscriptions_per_user']))
+             if author_id != user_id),
+            batch_size=options['batch_size'], ignore_conflicts=True)
@@ -0,0 +1,281 @@
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import counters, imaging, renditions
+from recipes.constants import (COOKING_MIN_TIME,
+                               INGREDIENT_MIN_AMOUNT,
+                               RECIPE_NAME_MAX_LENGTH)
+from recipes.fulltext import refresh_search_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.versions import USERS, bump_version, item
+from users.models import User
+
+# Наибольшее количество, которое помещается в PositiveSmallIntegerField.
+INGREDIENT_MAX_AMOUNT = 32767
+
+
+class Command(BaseCommand):
+    """Импорт рецептов партнёров из NDJSON."""
+
+    help = (
+        'Читает рецепты из файла NDJSON (по рецепту в строке, поля как у '
+        'POST /api/recipes/) и создаёт их от имени --author пачками: '
+        'проверка ссылок на теги и ингредиенты — по запросу на пачку, '
+        'картинки декодируются и проверяются в пуле процессов, рецепты, '
+        'теги и состав вставляются тремя bulk_create. Строки с ошибками '
+        'пропускаются и попадают в отчёт (--errors, NDJSON). Картинки '
+        'сохраняются до вставки пачки: если она не удалась, файлы без '
+        'рецептов удаляет collect_media_garbage.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON, - — stdin.')
+        parser.add_argument(
+            '--author', required=True, help='email автора рецептов.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--errors', help='Файл для отчёта об ошибках.')
+        parser.add_argument(
+            '--skip-renditions', action='store_true',
+            help='Не собирать копии картинок: их соберёт '
+                 'render_image_renditions.')
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(email=options['author']).first()
+        if author is None:
+            raise CommandError(f'Пользователь {options["author"]} не найден.')
+        workers = options['workers']
+        # Как и в render_image_renditions: spawn не копирует соединения с БД.
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context('spawn')
+        ) if workers > 1 else None
+        report = (
+            open(options['errors'], 'w', encoding='UTF-8')
+            if options['errors'] else None)
+        source = (
+            sys.stdin if options['path'] == '-'
+            else open(options['path'], encoding='UTF-8'))
+        started = time.monotonic()
+        created = failed = 0
+        images = set()
+        try:
+            lines = (
+                (number, line)
+                for number, line in enumerate(source, 1) if line.strip())
+            while batch := list(islice(lines, options['batch_size'])):
+                recipes, errors = self.import_batch(author, batch, executor)
+                created += len(recipes)
+                failed += len(errors)
+                images.update(recipe.image.name for recipe in recipes)
+                self.report(errors, report)
+            if not options['skip_renditions']:
+                self.render(executor, images)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if report is not None:
+                report.close()
+            if executor is not None:
+                executor.shutdown()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {created}, строк с ошибками: {failed}, '
+            f'{elapsed:.1f} с ({created / max(elapsed, 1e-3):.0f} '
+            f'рецептов/с).'))
+
+    def import_batch(self, author, batch, executor):
+        """Создаёт рецепты пачки, возвращает их и {строка: ошибки}."""
+        items = {}
+        errors = {}
+        for number, line in batch:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                errors[number] = {'non_field_errors': 'Некорректный JSON.'}
+                continue
+            problems = _check(data)
+            if problems:
+                errors[number] = problems
+            else:
+                items[number] = data
+        # Ссылки всей пачки проверяются одним IN-запросом на модель.
+        tag_ids = set(Tag.objects.filter(pk__in={
+            pk for data in items.values() for pk in data['tags']
+        }).values_list('pk', flat=True))
+        ingredient_ids = set(Ingredient.objects.filter(pk__in={
+            line['id'] for data in items.values()
+            for line in data['ingredients']
+        }).values_list('pk', flat=True))
+        for number, data in list(items.items()):
+            problems = {}
+            missing_tags = [pk for pk in data['tags'] if pk not in tag_ids]
+            if missing_tags:
+                problems['tags'] = 'Теги не найдены: {}.'.format(
+                    ', '.join(map(str, missing_tags)))
+            missing_ingredients = [
+                line['id'] for line in data['ingredients']
+                if line['id'] not in ingredient_ids]
+            if missing_ingredients:
+                problems['ingredients'] = (
+                    'Ингредиенты не найдены: {}.'.format(
+                        ', '.join(map(str, missing_ingredients))))
+            if problems:
+                errors[number] = problems
+                del items[number]
+        names = self.save_images(executor, items, errors)
+        recipes = [
+            Recipe(
+                author=author,
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                image=names[number])
+            for number, data in items.items() if number in names]
+        if not recipes:
+            return [], errors
+        compositions = [
+            data for number, data in items.items() if number in names]
+        try:
+            recipes = self.insert(author, recipes, compositions)
+        except Exception:
+            self.stderr.write(
+                f'Пачка не сохранена, картинок без рецептов: {len(names)}. '
+                'Их удалит collect_media_garbage.')
+            raise
+        return recipes, errors
+
+    def insert(self, author, recipes, compositions):
+        """Рецепты пачки с тегами и составом одной транзакцией."""
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(recipes)
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe, data in zip(recipes, compositions)
+                for tag_id in data['tags'])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe.id,
+                    ingredient_id=line['id'],
+                    amount=line['amount'])
+                for recipe, data in zip(recipes, compositions)
+                for line in data['ingredients'])
+            # bulk_create не шлёт сигналов: счётчик рецептов автора,
+            # поисковый индекс и версия автора обновляются здесь же.
+            counters.links_added(recipes)
+            refresh_search_index(recipe.id for recipe in recipes)
+            transaction.on_commit(
+                lambda: bump_version(item(USERS, author.pk)))
+        return recipes
+
+    def save_images(self, executor, items, errors):
+        """{строка: имя картинки}; ошибки картинок дописываются в errors.
+
+        Файлы сохраняются до вставки рецептов: если она не удастся, их
+        уберёт collect_media_garbage.
+        """
+        if executor is None:
+            decoded = {}
+            for number, data in items.items():
+                try:
+                    decoded[number] = imaging.decode(data['image'])
+                except ValueError as error:
+                    decoded[number] = error
+        else:
+            futures = {
+                number: executor.submit(imaging.decode, data['image'])
+                for number, data in items.items()}
+            decoded = {
+                number: future.exception() or future.result()
+                for number, future in futures.items()}
+        names = {}
+        for number, result in decoded.items():
+            if isinstance(result, Exception):
+                errors[number] = {'image': str(result)}
+                continue
+            extension, content = result
+            names[number] = default_storage.save(
+                f'images/import.{extension}', ContentFile(content))
+        return names
+
+    def render(self, executor, sources):
+        """Собирает копии новых картинок (см. render_image_renditions)."""
+        sizes = renditions.SIZES['image']
+        storage = Recipe._meta.get_field('image').storage
+        if executor is None:
+            for source in sources:
+                renditions.render_now(Recipe, source)
+            return
+        futures = {
+            source: executor.submit(
+                imaging.render, renditions.readable(storage, source), sizes)
+            for source in sources}
+        for source, future in futures.items():
+            try:
+                renditions.store(Recipe, source, None, future.result())
+            except Exception as error:
+                self.stderr.write(f'{source}: {error}')
+
+    def report(self, errors, report):
+        for number, problems in sorted(errors.items()):
+            self.stderr.write(f'Строка {number}: ' + '; '.join(
+                f'{field}: {message}' for field, message in problems.items()))
+            if report is not None:
+                report.write(json.dumps(
+                    {'line': number, 'errors': problems},
+                    ensure_ascii=False) + '\n')
+
+
+def _check(data):
+    """Ошибки полей рецепта, которые видны без обращения к базе."""
+    if not isinstance(data, dict):
+        return {'non_field_errors': 'Ожидается объект рецепта.'}
+    errors = {}
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip():
+        errors['name'] = 'Обязательное поле.'
+    elif len(name) > RECIPE_NAME_MAX_LENGTH:
+        errors['name'] = (
+            f'Не больше {RECIPE_NAME_MAX_LENGTH} символов.')
+    text = data.get('text')
+    if not isinstance(text, str) or not text.strip():
+        errors['text'] = 'Обязательное поле.'
+    if not _is_int(data.get('cooking_time'), COOKING_MIN_TIME):
+        errors['cooking_time'] = 'Нельзя приготовить так быстро.'
+    if not data.get('image'):
+        errors['image'] = 'Нужна фотография блюда.'
+    tags = data.get('tags')
+    if not isinstance(tags, list) or not tags:
+        errors['tags'] = 'Отсутствует обязательное поле tags.'
+    elif not all(_is_int(pk, 1) for pk in tags):
+        errors['tags'] = 'Ожидается список id тегов.'
+    elif len(set(tags)) != len(tags):
+        errors['tags'] = 'Теги должны быть уникальными.'
+    ingredients = data.get('ingredients')
+    if not isinstance(ingredients, list) or not ingredients:
+        errors['ingredients'] = 'Отсутствует обязательное поле ingredients.'
+    elif not all(
+        isinstance(line, dict) and _is_int(line.get('id'), 1)
+        and _is_int(
+            line.get('amount'), INGREDIENT_MIN_AMOUNT, INGREDIENT_MAX_AMOUNT)
+        for line in ingredients
+    ):
+        errors['ingredients'] = (
+            'Ожидается список {"id": ..., "amount": ...} с количеством от '
+            f'{INGREDIENT_MIN_AMOUNT} до {INGREDIENT_MAX_AMOUNT}.')
+    elif len({line['id'] for line in ingredients}) != len(ingredients):
+        errors['ingredients'] = 'Ингридиенты должны быть уникальными.'
+    return errors
+
+
+def _is_int(value, minimum, maximum=None):
+    return (
+        isinstance(value, int) and not isinstance(value, bool)
+        and value >= minimum and (maximum is None or value <= maximum))
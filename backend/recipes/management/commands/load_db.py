@@ -1,10 +1,11 @@
 import json
 
-from django.core.management.base import BaseCommand, CommandError
-from tqdm import tqdm
+from django.core.management.base import BaseCommand
 
 from api_foodgram.settings import PATH_TO_INGREDIENTS
-from recipes.models import Ingredient
+from recipes.constants import UNIT_CONVERSIONS
+from recipes.models import Ingredient, MeasurementUnit
+from recipes.versions import INGREDIENTS, bump_version
 
 
 class Command(BaseCommand):
@@ -15,9 +16,21 @@ class Command(BaseCommand):
         with open(PATH_TO_INGREDIENTS, encoding='UTF-8') as ingredients_file:
             ingredients = json.load(ingredients_file)
 
-            for ingredients in tqdm(ingredients):
-                try:
-                    Ingredient.objects.get_or_create(**ingredients)
-                except CommandError as e:
-                    raise CommandError(
-                        f'Ошибка {e} при добавлении {ingredients}.')
+        # Единицы каталога плюс известные переводимые (кг, л, ...),
+        # чтобы их можно было выбрать в админке.
+        units = MeasurementUnit.objects.resolve(
+            {ingredient['measurement_unit'] for ingredient in ingredients}
+            | set(UNIT_CONVERSIONS))
+        existing = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit_id'))
+        missing = {
+            (ingredient['name'], units[ingredient['measurement_unit']].pk)
+            for ingredient in ingredients} - existing
+        # bulk_create не шлёт сигналов: версия сбрасывается один раз ниже,
+        # а не на каждую строку.
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit_id=unit_id)
+            for name, unit_id in sorted(missing))
+        self.stdout.write(f'Добавлено ингредиентов: {len(missing)}.')
+        # Сброс и без новых строк: справочник могли править в обход ORM.
+        bump_version(INGREDIENTS)
@@ -1,10 +1,10 @@
 import json
 
-from django.core.management.base import BaseCommand, CommandError
-from tqdm import tqdm
+from django.core.management.base import BaseCommand
 
 from api_foodgram.settings import PATH_TO_TAGS
 from recipes.models import Tag
+from recipes.versions import TAGS, bump_version
 
 
 class Command(BaseCommand):
@@ -15,9 +15,11 @@ class Command(BaseCommand):
         with open(PATH_TO_TAGS, encoding='UTF-8') as tag_file:
             tags = json.load(tag_file)
 
-            for tag in tqdm(tags):
-                try:
-                    Tag.objects.get_or_create(**tag)
-                except CommandError as e:
-                    raise CommandError(
-                        f'Ошибка {e} при добавлении {tag}.')
+        existing = set(Tag.objects.values_list('name', 'slug'))
+        missing = [
+            tag for tag in tags if (tag['name'], tag['slug']) not in existing]
+        # bulk_create не шлёт сигналов: версия сбрасывается один раз ниже.
+        Tag.objects.bulk_create(Tag(**tag) for tag in missing)
+        self.stdout.write(f'Добавлено тегов: {len(missing)}.')
+        # Сброс и без новых строк: справочник могли править в обход ORM.
+        bump_version(TAGS)
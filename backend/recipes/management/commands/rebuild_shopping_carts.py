@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import shopping_cart
+from recipes.versions import CARTS, bump_versions, item
+
+# Сколько расхождений показывать в выводе.
+SHOWN_DIFFERENCES = 20
+
+
+class Command(BaseCommand):
+    """Пересборка и сверка сумм ингредиентов в корзинах."""
+
+    help = (
+        'Пересобирает таблицу ShoppingCartItem из корзин пользователей '
+        'и сверяет её с агрегатом по рецептам. С --check только '
+        'сравнивает и завершается ошибкой при расхождениях.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true')
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя; можно указать несколько раз.')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        differences = shopping_cart.differences(user_ids)
+        for (user_id, ingredient_id), (stored, live) in sorted(
+                differences.items())[:SHOWN_DIFFERENCES]:
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'в таблице {stored}, по корзине {live}.')
+        if options['check']:
+            if differences:
+                raise CommandError(
+                    f'Расхождений в корзинах: {len(differences)}.')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        shopping_cart.rebuild(user_ids)
+        bump_versions(
+            item(CARTS, user_id)
+            for user_id in {user_id for user_id, _ in differences})
+        remaining = shopping_cart.differences(user_ids)
+        if remaining:
+            raise CommandError(
+                f'После пересборки осталось расхождений: {len(remaining)}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Таблица пересобрана, исправлено расхождений: '
+            f'{len(differences)}.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    """Сверка и починка хранимых счётчиков."""
+
+    help = (
+        'Сравнивает счётчики рецептов в избранном и корзинах, рецептов '
+        'автора, подписчиков и подписок с подсчётом по таблицам связей и '
+        'исправляет расхождения. С --check только сравнивает и '
+        'завершается ошибкой при расхождениях.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = {
+                name: rows
+                for name, rows in counters.drift().items() if rows}
+            for name, rows in drift.items():
+                self.stdout.write(f'{name}: расходится строк {rows}.')
+            if drift:
+                raise CommandError('Счётчики расходятся с таблицами связей.')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        fixed = counters.reconcile()
+        for name, rows in fixed.items():
+            self.stdout.write(f'{name}: исправлено строк {rows}.')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены.'))
@@ -0,0 +1,69 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+
+from recipes import imaging, renditions
+
+# Исходников в обработке на один процесс.
+BATCH_PER_WORKER = 4
+
+
+class Command(BaseCommand):
+    """Сборка уменьшенных копий картинок рецептов и аватаров."""
+
+    help = (
+        'Собирает копии WebP и JPEG для картинок рецептов и аватаров, у '
+        'которых их ещё нет (например, загруженных до появления копий). '
+        'Одинаковые картинки обрабатываются один раз. С --all '
+        'пересобирает все копии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context('spawn')
+        ) as executor:
+            for model, (field, _) in renditions.FIELDS.items():
+                sources = self.pending(model, field, options['all'])
+                failed = 0
+                # Исходники читаются пачками, чтобы не держать все в памяти.
+                step = workers * BATCH_PER_WORKER
+                for start in range(0, len(sources), step):
+                    failed += self.render(
+                        executor, model, field, sources[start:start + step])
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: картинок '
+                    f'{len(sources) - failed}, ошибок {failed}.')
+
+    def pending(self, model, field, everything):
+        """Имена картинок, копии которых нужно собрать."""
+        sources = {}
+        for source, current in model.objects.exclude(
+            **{field: ''}
+        ).exclude(
+            **{f'{field}__isnull': True}
+        ).values_list(field, f'{field}_renditions').iterator():
+            if everything or current.get('source') != source:
+                sources[source] = None
+        return list(sources)
+
+    def render(self, executor, model, field, sources):
+        """Собирает копии sources, возвращает число ошибок."""
+        storage = model._meta.get_field(field).storage
+        futures = {}
+        for source in sources:
+            futures[executor.submit(
+                imaging.render, renditions.readable(storage, source),
+                renditions.SIZES[field])] = source
+        failed = 0
+        for future in as_completed(futures):
+            try:
+                renditions.store(model, futures[future], None, future.result())
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{futures[future]}: {error}')
+        return failed
@@ -0,0 +1,68 @@
+from django.db import NotSupportedError, migrations
+
+# Копия SQL из recipes.fulltext на момент миграции.
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+INGREDIENT_NAMES_SQL = (
+    "SELECT {aggregate} FROM recipes_recipeingredient ri "
+    "JOIN recipes_ingredient i ON i.id = ri.ingredient_id "
+    "WHERE ri.recipe_id = r.id")
+
+POSTGRESQL_SCHEMA = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipes_recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+    "UPDATE recipes_recipe AS r SET search_vector = "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', r.name), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(("
+    + INGREDIENT_NAMES_SQL.format(aggregate="string_agg(i.name, ' ')")
+    + "), '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', r.text), 'C')",
+)
+POSTGRESQL_DROP = (
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+SQLITE_SCHEMA = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    "name, ingredients, text, tokenize='unicode61 remove_diacritics 2')",
+    f"INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) "
+    "SELECT r.id, r.name, coalesce(("
+    + INGREDIENT_NAMES_SQL.format(aggregate="group_concat(i.name, ' ')")
+    + "), ''), r.text FROM recipes_recipe r",
+)
+SQLITE_DROP = (
+    f'DROP TABLE {FTS_TABLE}',
+)
+
+
+def run(schema_editor, postgresql, sqlite):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = postgresql
+    elif vendor == 'sqlite':
+        statements = sqlite
+    else:
+        raise NotSupportedError(
+            f'Полнотекстовый поиск не поддерживается для {vendor}.')
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def forwards(apps, schema_editor):
+    run(schema_editor, POSTGRESQL_SCHEMA, SQLITE_SCHEMA)
+
+
+def backwards(apps, schema_editor):
+    run(schema_editor, POSTGRESQL_DROP, SQLITE_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_alter_recipeingredient_recipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
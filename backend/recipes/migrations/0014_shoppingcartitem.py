@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+FILL_FROM_CARTS = (
+    'INSERT INTO recipes_shoppingcartitem '
+    '(user_id, ingredient_id, total_amount) '
+    'SELECT cart.user_id, ri.ingredient_id, SUM(ri.amount) '
+    'FROM recipes_shoppinglist cart '
+    'JOIN recipes_recipeingredient ri ON ri.recipe_id = cart.recipe_id '
+    'GROUP BY cart.user_id, ri.ingredient_id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в корзине',
+                'verbose_name_plural': 'Ингредиенты в корзине',
+                'default_related_name': 'shopping_cart_items',
+                'constraints': [models.UniqueConstraint(fields=('user', 'ingredient'), name='shoppingcartitem_unique')],
+            },
+        ),
+        migrations.RunSQL(FILL_FROM_CARTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:52
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_shoppingcartitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='Единица измерения')),
+                ('factor', models.PositiveIntegerField(default=1, help_text='Сколько базовых единиц в одной этой.', validators=[django.core.validators.MinValueValidator(1)], verbose_name='Коэффициент')),
+                ('base', models.ForeignKey(blank=True, help_text='Пусто, если единица сама базовая.', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='derived_units', to='recipes.measurementunit', verbose_name='Базовая единица')),
+            ],
+            options={
+                'verbose_name': 'Единица измерения',
+                'verbose_name_plural': 'Единицы измерения',
+                'ordering': ('name',),
+            },
+        ),
+        # Старая колонка допускает NULL, чтобы при откате миграции 0017
+        # её можно было вернуть пустой и заполнить в 0016.
+        migrations.AlterField(
+            model_name='ingredient',
+            name='measurement_unit',
+            field=models.CharField(max_length=64, null=True, verbose_name='Единица измерения'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='unit',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='recipes.measurementunit'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:52
+
+from django.db import migrations
+
+# Копия recipes.constants.UNIT_CONVERSIONS на момент миграции.
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+    'ч. л.': ('мл', 5),
+    'ст. л.': ('мл', 15),
+    'стакан': ('мл', 200),
+}
+
+
+def units_forwards(apps, schema_editor):
+    """Строки measurement_unit -> записи MeasurementUnit."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    MeasurementUnit = apps.get_model('recipes', 'MeasurementUnit')
+    names = set(Ingredient.objects.values_list(
+        'measurement_unit', flat=True).distinct()) | set(UNIT_CONVERSIONS)
+    names |= {base for base, _ in UNIT_CONVERSIONS.values()}
+    units = {}
+    for name in sorted(names, key=lambda name: name in UNIT_CONVERSIONS):
+        base, factor = UNIT_CONVERSIONS.get(name, (None, 1))
+        units[name] = MeasurementUnit.objects.create(
+            name=name, base=units.get(base), factor=factor)
+    for name, unit in units.items():
+        Ingredient.objects.filter(measurement_unit=name).update(unit=unit)
+
+
+def units_backwards(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    MeasurementUnit = apps.get_model('recipes', 'MeasurementUnit')
+    for unit in MeasurementUnit.objects.all():
+        Ingredient.objects.filter(unit=unit).update(
+            measurement_unit=unit.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_measurementunit'),
+    ]
+
+    operations = [
+        migrations.RunPython(units_forwards, units_backwards),
+    ]
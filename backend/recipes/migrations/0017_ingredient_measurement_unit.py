@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_ingredient_units'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='ingredient',
+            name='measurement_unit',
+        ),
+        migrations.RenameField(
+            model_name='ingredient',
+            old_name='unit',
+            new_name='measurement_unit',
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='measurement_unit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ingredients', to='recipes.measurementunit', verbose_name='Единица измерения'),
+        ),
+    ]
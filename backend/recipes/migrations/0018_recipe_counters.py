@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (модель со счётчиком, поле счётчика, модель связи, FK на владельца)
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'shopping_carts_count', 'recipes.ShoppingList',
+     'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Subscription', 'author'),
+    ('users.User', 'following_count', 'users.Subscription', 'subscriber'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for owner, counter, link, field in COUNTERS:
+        links = apps.get_model(link).objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(count=Count('pk')).values('count')
+        apps.get_model(owner).objects.update(
+            **{counter: Coalesce(Subquery(links), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_ingredient_measurement_unit'),
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Имя')),
+                ('value', models.CharField(max_length=32, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия кэша',
+                'verbose_name_plural': 'Версии кэша',
+            },
+        ),
+    ]
@@ -1,15 +1,27 @@
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
-
+from django.db.models import (Exists,
+                              F,
+                              OuterRef,
+                              Prefetch,
+                              UniqueConstraint,
+                              Value,
+                              Window)
+from django.db.models.functions import RowNumber
+
+from users.models import CountersMixin, Subscription
 from .constants import (COOKING_MIN_TIME,
                         INGREDIENT_MAX_LENGTH,
                         INGREDIENT_MIN_AMOUNT,
                         MEASUREMENT_MAX_LENGTH,
                         RECIPE_NAME_MAX_LENGTH,
                         TAG_MAX_LENGTH,
-                        SHORT_LINK_MAX_LENGTH)
+                        SHORT_LINK_MAX_LENGTH,
+                        UNIT_CONVERSIONS,
+                        VERSION_NAME_MAX_LENGTH,
+                        VERSION_VALUE_MAX_LENGTH)
 
 
 User = get_user_model()
@@ -40,14 +52,88 @@ class Tag(models.Model):
         return self.name
 
 
+class MeasurementUnitManager(models.Manager):
+
+    def resolve(self, names):
+        """Единицы с названиями names {название: единица}.
+
+        Недостающие создаются; для известных из UNIT_CONVERSIONS
+        заодно создаётся базовая единица и проставляется перевод.
+        """
+        names = set(names)
+        bases = {
+            UNIT_CONVERSIONS[name][0]
+            for name in names if name in UNIT_CONVERSIONS}
+        units = {unit.name: unit for unit in self.filter(
+            name__in=names | bases)}
+        # Базовые единицы создаются раньше переводимых в них.
+        for name in sorted(
+                names | bases, key=lambda name: name in UNIT_CONVERSIONS):
+            if name in units:
+                continue
+            base, factor = UNIT_CONVERSIONS.get(name, (None, 1))
+            units[name] = self.create(
+                name=name, base=units.get(base), factor=factor)
+        return units
+
+
+class MeasurementUnit(models.Model):
+    """Единица измерения и её перевод в базовую единицу той же величины.
+
+    В списке покупок количества ингредиентов с одним названием
+    переводятся в базовую единицу и складываются.
+    """
+
+    name = models.CharField(
+        max_length=MEASUREMENT_MAX_LENGTH,
+        unique=True,
+        verbose_name='Единица измерения')
+
+    base = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='derived_units',
+        verbose_name='Базовая единица',
+        help_text='Пусто, если единица сама базовая.')
+
+    factor = models.PositiveIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        verbose_name='Коэффициент',
+        help_text='Сколько базовых единиц в одной этой.')
+
+    objects = MeasurementUnitManager()
+
+    class Meta:
+        ordering = ('name',)
+        verbose_name = 'Единица измерения'
+        verbose_name_plural = 'Единицы измерения'
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if self.base is None:
+            if self.factor != 1:
+                raise ValidationError(
+                    {'factor': 'У базовой единицы коэффициент равен 1.'})
+        elif self.base.base_id is not None or self.base.pk == self.pk:
+            raise ValidationError(
+                {'base': 'Базовая единица должна быть базовой сама.'})
+
+
 class Ingredient(models.Model):
 
     name = models.CharField(
         max_length=INGREDIENT_MAX_LENGTH,
         verbose_name='Ингредиент')
 
-    measurement_unit = models.CharField(
-        max_length=MEASUREMENT_MAX_LENGTH,
+    measurement_unit = models.ForeignKey(
+        MeasurementUnit,
+        on_delete=models.PROTECT,
+        related_name='ingredients',
         verbose_name='Единица измерения')
 
     class Meta:
@@ -59,7 +145,50 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для чтения без N+1 запросов."""
+
+    def with_related(self):
+        """Автор одним JOIN, теги и ингредиенты — пакетно."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient__measurement_unit')))
+
+    def with_user_flags(self, user):
+        """Флаги избранного, корзины и подписки на автора для user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed_to_author=Value(False))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_subscribed_to_author=Exists(Subscription.objects.filter(
+                subscriber=user, author=OuterRef('author'))))
+
+    def limited_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора.
+
+        Нумерация ROW_NUMBER() по автору позволяет выбрать рецепты
+        всех авторов страницы одним запросом.
+        """
+        return self.annotate(
+            author_row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=F('id').desc())
+        ).filter(author_row_number__lte=limit)
+
+
+class Recipe(CountersMixin, models.Model):
+
+    COUNTER_FIELDS = ('favorites_count', 'shopping_carts_count')
 
     author = models.ForeignKey(
         User,
@@ -77,6 +206,13 @@ class Recipe(models.Model):
         upload_to='images',
         verbose_name='Картинка')
 
+    # Заполняется recipes.renditions.
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии картинки')
+
     name = models.CharField(
         max_length=RECIPE_NAME_MAX_LENGTH,
         verbose_name='Название блюда')
@@ -94,6 +230,19 @@ class Recipe(models.Model):
         blank=True,
         null=True)
 
+    # Поддерживаются recipes.counters.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном')
+
+    shopping_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок')
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         default_related_name = 'recipes'
         verbose_name = 'Рецепт'
@@ -177,3 +326,57 @@ class ShoppingList(FavoriteAndShoppingListModel):
 
     def __str__(self):
         return f'Продукты для {self.recipe} добавлены в список покупок.'
+
+
+class ShoppingCartItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Обновляется приращениями в recipes.shopping_cart.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь')
+
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент')
+
+    total_amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
+        default_related_name = 'shopping_cart_items'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='shoppingcartitem_unique')]
+
+    def __str__(self):
+        return f'{self.user} — {self.ingredient}: {self.total_amount}'
+
+
+class CatalogVersion(models.Model):
+    """Версия справочника или объекта в базе (см. recipes.versions).
+
+    Используется, когда кэш Django не общий для процессов.
+    """
+
+    name = models.CharField(
+        max_length=VERSION_NAME_MAX_LENGTH,
+        primary_key=True,
+        verbose_name='Имя')
+
+    value = models.CharField(
+        max_length=VERSION_VALUE_MAX_LENGTH,
+        verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия кэша'
+        verbose_name_plural = 'Версии кэша'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
@@ -0,0 +1,169 @@
+"""Уменьшенные копии картинок рецептов и аватаров в WebP и JPEG.
+
+После сохранения новой картинки задача уходит в пул процессов (см.
+recipes.imaging), запрос её не ждёт. Копии сохраняются в хранилище, как
+и исходник (см. recipes.storage), а карта имён записывается в поле
+<поле>_renditions вместе с именем исходника: карта, составленная для
+другой картинки, считается пустой, пока копии не пересобраны.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from multiprocessing import get_context
+from os.path import basename, join, splitext
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+
+from users.models import User
+from . import imaging
+from .models import Recipe
+from .versions import RECIPES, USERS, bump_versions, item
+
+logger = logging.getLogger(__name__)
+
+# Поле картинки -> {размер: наибольшая сторона в пикселях}.
+SIZES = {
+    'image': {'small': 320, 'medium': 640, 'large': 1280},
+    'avatar': {'small': 64, 'medium': 192},
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+# Модель -> (поле картинки, версия, сбрасываемая после сборки копий).
+FIELDS = {
+    Recipe: ('image', RECIPES),
+    User: ('avatar', USERS),
+}
+
+
+def is_current(instance, field):
+    """Собраны ли копии для текущей картинки instance."""
+    image = getattr(instance, field)
+    renditions = getattr(instance, f'{field}_renditions')
+    return bool(image) and renditions.get('source') == image.name
+
+
+def urls(instance, field, request=None):
+    """{размер: {формат: ссылка}} или {}, пока копий нет."""
+    if not is_current(instance, field):
+        return {}
+    storage = getattr(instance, field).storage
+    return {
+        size: {
+            name: _absolute(storage.url(path), request)
+            for name, path in formats.items()}
+        for size, formats in getattr(
+            instance, f'{field}_renditions')['sizes'].items()}
+
+
+def schedule(instance):
+    """Собрать копии картинки instance после коммита транзакции."""
+    field, _ = FIELDS[type(instance)]
+    if getattr(instance, field) and not is_current(instance, field):
+        transaction.on_commit(partial(
+            pool.submit, type(instance), instance.pk,
+            getattr(instance, field).name))
+
+
+def render_now(model, source, pks=None):
+    """Синхронно собирает копии source и записывает их (см. store)."""
+    field, _ = FIELDS[model]
+    storage = model._meta.get_field(field).storage
+    rendered = imaging.render(readable(storage, source), SIZES[field])
+    store(model, source, pks, rendered)
+
+
+def readable(storage, source):
+    """Путь к исходнику для imaging.render, а без него — его байты.
+
+    По пути процесс пула читает файл сам, и картинка не проходит через
+    память воркера.
+    """
+    try:
+        return storage.path(source)
+    except NotImplementedError:
+        with storage.open(source) as file:
+            return file.read()
+
+
+def store(model, source, pks, rendered):
+    """Сохраняет копии и карту имён строкам, где картинка — source.
+
+    pks ограничивает строки; None — все строки с этой картинкой.
+    """
+    field, version = FIELDS[model]
+    model_field = model._meta.get_field(field)
+    # Копии кладутся в upload_to, а не рядом с исходником: хранилище по
+    # хэшу раскладывает их по подкаталогам так же, как исходники.
+    stem, _ = splitext(basename(source))
+    sizes = {}
+    for size, formats in rendered.items():
+        sizes[size] = {}
+        for name, data in formats.items():
+            sizes[size][name] = model_field.storage.save(
+                join(model_field.upload_to,
+                     f'{stem}.{size}.{EXTENSIONS[name]}'),
+                ContentFile(data))
+    # Картинку могли сменить, пока собирались копии: тогда не трогаем.
+    rows = model.objects.filter(**{field: source})
+    if pks is not None:
+        rows = rows.filter(pk__in=pks)
+    updated = list(rows.values_list('pk', flat=True))
+    rows.update(**{f'{field}_renditions': {'source': source, 'sizes': sizes}})
+    bump_versions(item(version, pk) for pk in updated)
+
+
+class RenditionPool:
+    """Пул процессов для сборки копий, создаётся при первой задаче.
+
+    IMAGE_RENDITION_WORKERS = 0 собирает копии в текущем потоке
+    (тесты, отладка).
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = Lock()
+
+    def submit(self, model, pk, source):
+        workers = settings.IMAGE_RENDITION_WORKERS
+        if not workers:
+            render_now(model, source, [pk])
+            return
+        field, _ = FIELDS[model]
+        data = readable(model._meta.get_field(field).storage, source)
+        try:
+            future = self._get(workers).submit(
+                imaging.render, data, SIZES[field])
+        except BrokenProcessPool:
+            self._executor = None
+            future = self._get(workers).submit(
+                imaging.render, data, SIZES[field])
+        future.add_done_callback(partial(_done, model, pk, source))
+
+    def _get(self, workers):
+        with self._lock:
+            if self._executor is None:
+                # spawn: дочерние процессы не наследуют соединения с БД
+                # и потоки воркера gunicorn.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=get_context('spawn'))
+            return self._executor
+
+
+def _done(model, pk, source, future):
+    # Обычно вызывается в служебном потоке пула со своим соединением с БД;
+    # после ошибки оно закрывается, чтобы следующая задача открыла новое.
+    try:
+        store(model, source, [pk], future.result())
+    except Exception:
+        logger.exception('Не удалось собрать копии %s', source)
+        connections.close_all()
+
+
+def _absolute(url, request):
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+pool = RenditionPool()
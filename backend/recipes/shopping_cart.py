@@ -0,0 +1,207 @@
+"""Суммы ингредиентов в корзинах (ShoppingCartItem) без пересчёта.
+
+Каждое событие превращается в приращения {ингредиент: количество},
+которые одним INSERT ... ON CONFLICT DO UPDATE прибавляются к строкам
+всех корзин с рецептом: добавление рецепта в корзину — его количества,
+удаление — те же со знаком минус, правка ингредиентов — разница между
+новым и старым составом. Строки с нулём удаляются. rebuild и
+differences пересобирают и сверяют таблицу с живым агрегатом.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from .models import RecipeIngredient, ShoppingCartItem, ShoppingList
+
+ITEMS_TABLE = ShoppingCartItem._meta.db_table
+CARTS_TABLE = ShoppingList._meta.db_table
+LINES_TABLE = RecipeIngredient._meta.db_table
+
+
+def recipe_amounts(recipe):
+    """Состав рецепта {id ингредиента: количество}.
+
+    Использует prefetch recipe_ingredients, если он уже загружен.
+    """
+    amounts = Counter()
+    for recipe_ingredient in recipe.recipe_ingredients.all():
+        amounts[recipe_ingredient.ingredient_id] += recipe_ingredient.amount
+    return amounts
+
+
+def add_recipe(user_id, recipe_id):
+    """Рецепт добавлен в корзину user_id."""
+    _apply(recipe_id, _amounts_by_id(recipe_id), user_id)
+
+
+def remove_recipe(user_id, recipe_id):
+    """Рецепт убирается из корзины user_id (до удаления строки)."""
+    _apply(recipe_id, _negate(_amounts_by_id(recipe_id)), user_id)
+
+
+def add_recipes(user_id, recipe_ids):
+    """Рецепты recipe_ids добавлены в корзину user_id одной пачкой."""
+    _apply_recipes(user_id, recipe_ids, 1)
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Рецепты recipe_ids убраны из корзины user_id (строки уже удалены)."""
+    _apply_recipes(user_id, recipe_ids, -1)
+
+
+def clear(user_id):
+    """Корзина user_id очищена."""
+    ShoppingCartItem.objects.filter(user_id=user_id).delete()
+
+
+def remove_recipe_everywhere(recipe):
+    """Рецепт удаляется: убрать его из всех корзин."""
+    _apply(recipe.pk, _negate(recipe_amounts(recipe)))
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """Состав рецепта изменился: поправить все корзины с ним."""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    _apply(recipe_id, deltas)
+
+
+def live_totals(user_ids=None):
+    """Агрегат по корзинам {(user_id, ingredient_id): сумма}."""
+    # Условия на корзину в одном filter(), иначе JOIN задвоится.
+    if user_ids is None:
+        rows = RecipeIngredient.objects.filter(
+            recipe__shopping_list__isnull=False)
+    else:
+        rows = RecipeIngredient.objects.filter(
+            recipe__shopping_list__user__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.values(
+            'recipe__shopping_list__user', 'ingredient'
+        ).annotate(
+            total=Sum('amount')
+        ).values_list('recipe__shopping_list__user', 'ingredient', 'total')}
+
+
+def stored_totals(user_ids=None):
+    """Содержимое ShoppingCartItem {(user_id, ingredient_id): сумма}."""
+    items = ShoppingCartItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in items.values_list(
+            'user', 'ingredient', 'total_amount')}
+
+
+def differences(user_ids=None):
+    """Расхождения таблицы с агрегатом: {(user, ingredient): (было, надо)}."""
+    live = live_totals(user_ids)
+    stored = stored_totals(user_ids)
+    return {
+        key: (stored.get(key), live.get(key))
+        for key in live.keys() | stored.keys()
+        if stored.get(key) != live.get(key)}
+
+
+@transaction.atomic
+def rebuild(user_ids=None, batch_size=1000):
+    """Пересобирает таблицу (или корзины user_ids) из агрегата."""
+    items = ShoppingCartItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    items.delete()
+    ShoppingCartItem.objects.bulk_create(
+        (ShoppingCartItem(
+            user_id=user_id, ingredient_id=ingredient_id, total_amount=total)
+         for (user_id, ingredient_id), total in live_totals(
+             user_ids).items()),
+        batch_size=batch_size)
+
+
+def rebuild_recipe_carts(recipe_ids):
+    """Пересобирает корзины с рецептами recipe_ids, возвращает их id."""
+    user_ids = set(ShoppingList.objects.filter(
+        recipe_id__in=recipe_ids).values_list('user_id', flat=True))
+    if user_ids:
+        rebuild(user_ids)
+    return user_ids
+
+
+def _amounts_by_id(recipe_id):
+    """Состав рецепта без загрузки самого рецепта."""
+    amounts = Counter()
+    for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount'):
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+def _negate(amounts):
+    return {ingredient_id: -amount for ingredient_id, amount in
+            amounts.items()}
+
+
+def _apply(recipe_id, deltas, user_id=None):
+    """Прибавляет deltas к корзинам с рецептом (или к одной корзине)."""
+    deltas = {
+        ingredient_id: amount
+        for ingredient_id, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    rows = ' UNION ALL '.join(
+        ['SELECT CAST(%s AS bigint) AS ingredient_id, '
+         'CAST(%s AS integer) AS amount']
+        + ['SELECT %s, %s'] * (len(deltas) - 1))
+    carts = 'cart.recipe_id = %s'
+    cart_params = [recipe_id]
+    if user_id is not None:
+        carts += ' AND cart.user_id = %s'
+        cart_params.append(user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ITEMS_TABLE} '
+            f'(user_id, ingredient_id, total_amount) '
+            f'SELECT cart.user_id, delta.ingredient_id, delta.amount '
+            f'FROM {CARTS_TABLE} cart CROSS JOIN ({rows}) delta '
+            f'WHERE {carts} '
+            f'ON CONFLICT (user_id, ingredient_id) DO UPDATE SET '
+            f'total_amount = {ITEMS_TABLE}.total_amount '
+            f'+ excluded.total_amount',
+            [value for pair in deltas.items() for value in pair]
+            + cart_params)
+        if min(deltas.values()) < 0:
+            cursor.execute(
+                f'DELETE FROM {ITEMS_TABLE} WHERE total_amount <= 0 '
+                f'AND user_id IN (SELECT cart.user_id FROM {CARTS_TABLE} '
+                f'cart WHERE {carts})',
+                cart_params)
+
+
+def _apply_recipes(user_id, recipe_ids, sign):
+    """Прибавляет к корзине user_id составы recipe_ids со знаком sign.
+
+    Суммы по ингредиентам считаются в том же INSERT.
+    """
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ITEMS_TABLE} '
+            f'(user_id, ingredient_id, total_amount) '
+            f'SELECT CAST(%s AS bigint), line.ingredient_id, '
+            f'CAST(%s AS integer) * SUM(line.amount) '
+            f'FROM {LINES_TABLE} line '
+            f'WHERE line.recipe_id IN ({", ".join(["%s"] * len(recipe_ids))}) '
+            f'GROUP BY line.ingredient_id '
+            f'ON CONFLICT (user_id, ingredient_id) DO UPDATE SET '
+            f'total_amount = {ITEMS_TABLE}.total_amount '
+            f'+ excluded.total_amount',
+            [user_id, sign, *recipe_ids])
+        if sign < 0:
+            cursor.execute(
+                f'DELETE FROM {ITEMS_TABLE} WHERE total_amount <= 0 '
+                f'AND user_id = %s',
+                [user_id])
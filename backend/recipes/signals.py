@@ -0,0 +1,136 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import Subscription, User
+from . import counters, renditions, shopping_cart
+from .fulltext import delete_from_search_index, refresh_search_index
+from .models import (Favorite,
+                     Ingredient,
+                     MeasurementUnit,
+                     Recipe,
+                     ShoppingList,
+                     Tag)
+from .versions import (CARTS,
+                       INGREDIENTS,
+                       RECIPES,
+                       TAGS,
+                       USERS,
+                       bump_version,
+                       bump_versions,
+                       item)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=MeasurementUnit)
+def ingredient_changed(**kwargs):
+    # Версия сбрасывается после коммита: иначе другой процесс мог бы
+    # собрать индекс из старых строк и закэшировать его под новой версией.
+    transaction.on_commit(lambda: bump_version(INGREDIENTS))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(instance, created, **kwargs):
+    # Названия ингредиентов входят в поисковый текст рецептов с ними.
+    if not created:
+        transaction.on_commit(lambda: refresh_search_index(
+            recipes_with_ingredient(instance.pk)))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(instance, **kwargs):
+    # Строки состава удалятся каскадом, рецепты нужно запомнить до этого.
+    recipe_ids = recipes_with_ingredient(instance.pk)
+    transaction.on_commit(lambda: refresh_search_index(recipe_ids))
+
+
+def recipes_with_ingredient(ingredient_id):
+    return list(Recipe.objects.filter(
+        recipe_ingredients__ingredient_id=ingredient_id
+    ).values_list('id', flat=True).distinct())
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, created, **kwargs):
+    # После коммита теги и ингредиенты рецепта уже записаны (API и админка
+    # сохраняют их в одной транзакции с рецептом), а версия не сбросится
+    # раньше, чем новые данные станут видны читателям.
+    transaction.on_commit(lambda: refresh_search_index([instance.pk]))
+    transaction.on_commit(lambda: bump_version(item(RECIPES, instance.pk)))
+    if not created:
+        transaction.on_commit(lambda: bump_carts_with_recipe(instance.pk))
+
+
+@receiver((post_save, post_delete), sender=ShoppingList)
+def shopping_cart_changed(instance, **kwargs):
+    transaction.on_commit(
+        lambda: bump_version(item(CARTS, instance.user_id)))
+
+
+@receiver(post_save, sender=ShoppingList)
+def recipe_added_to_cart(instance, created, **kwargs):
+    if created:
+        shopping_cart.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def recipe_removed_from_cart(instance, origin, **kwargs):
+    # При удалении рецепта корзины правит recipe_deleting, при удалении
+    # пользователя его суммы удаляются каскадом.
+    if getattr(origin, 'model', type(origin)) is ShoppingList:
+        shopping_cart.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    # pre_delete приходит до каскадного удаления состава и корзин.
+    shopping_cart.remove_recipe_everywhere(instance)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Subscription)
+@receiver(post_save, sender=Recipe)
+def counted_link_saved(instance, created, **kwargs):
+    if created:
+        counters.link_added(instance)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Recipe)
+def counted_link_deleted(instance, origin, **kwargs):
+    counters.link_removed(instance, origin)
+
+
+def bump_carts_with_recipe(recipe_id):
+    """Ингредиенты рецепта изменились: сбросить корзины с ним."""
+    bump_versions(
+        item(CARTS, user_id)
+        for user_id in ShoppingList.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(instance, **kwargs):
+    renditions.schedule(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, update_fields, **kwargs):
+    # Вход обновляет только last_login, в представлениях его нет.
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(lambda: bump_version(item(USERS, instance.pk)))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    delete_from_search_index([instance.pk])
@@ -0,0 +1,67 @@
+"""Хранилище медиафайлов, адресуемых по содержимому.
+
+Имя файла — хэш его байтов, разложенный по подкаталогам:
+images/3f/a9/3fa9….png. Одинаковые загрузки хранятся один раз, а в
+каталоге остаётся немного файлов. Поэтому файл может принадлежать
+нескольким строкам и удалять его при удалении строки нельзя: ненужные
+файлы убирает команда collect_media_garbage.
+"""
+import hashlib
+import os
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+
+# Байтов в хэше; в имени вдвое больше шестнадцатеричных знаков.
+DIGEST_SIZE = 20
+# Уровни подкаталогов и знаков хэша в имени каждого из них.
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def content_digest(content):
+    """Хэш содержимого файла content в шестнадцатеричном виде."""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, content):
+    """Имя для content в каталоге name с расширением name."""
+    digest = content_digest(content)
+    directory, filename = os.path.split(name)
+    shards = [
+        digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_LEVELS)]
+    return os.path.join(
+        directory, *shards,
+        digest + os.path.splitext(filename)[1].lower())
+
+
+def is_stored_as(field_file, content):
+    """Хранится ли в field_file уже файл с тем же содержимым."""
+    if not field_file:
+        return False
+    stem = os.path.splitext(os.path.basename(field_file.name))[0]
+    return stem == content_digest(content)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, сохраняющий файлы под хэшем содержимого."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content)
+        # Такие же байты уже сохранены. Если их одновременно сохраняет
+        # параллельный запрос, вторая копия получит суффикс FileSystemStorage.
+        if self.exists(name):
+            # Свежее время изменения не даёт collect_media_garbage удалить
+            # файл, пока строка со ссылкой на него не сохранена.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
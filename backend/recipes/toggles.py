@@ -0,0 +1,175 @@
+"""Добавление и удаление связей избранного, корзины и подписок.
+
+Связь добавляется одним INSERT ... ON CONFLICT DO NOTHING RETURNING, а
+удаляется одним DELETE ... RETURNING: повторное нажатие отсекает
+уникальное ограничение, а не проверка exists() перед записью, которую
+обгоняет параллельный запрос. Сигналы моделей при этом не отправляются,
+поэтому счётчики, суммы корзины и её версия меняются здесь же и только
+если строка действительно добавлена или удалена. Вызывать внутри
+transaction.atomic, как и запись через ORM.
+
+add_many, remove_many и clear делают то же для пачки рецептов
+пользователя в избранном или корзине: один INSERT ... SELECT или DELETE
+на всю пачку, счётчики и суммы корзины — тоже пачкой.
+"""
+from django.db import connection, transaction
+
+from . import counters, shopping_cart
+from .models import Recipe, ShoppingList
+from .versions import CARTS, bump_version, item
+
+
+def add(model, **fields):
+    """Добавляет связь model(**fields); False, если она уже есть."""
+    link = _link(model, fields)
+    columns, values = _columns(link, fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_table(model)} ({", ".join(columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(values))}) '
+            f'ON CONFLICT DO NOTHING RETURNING {_pk(model)}', values)
+        row = cursor.fetchone()
+    if row is None:
+        return False
+    link.pk = row[0]
+    counters.link_added(link)
+    if model is ShoppingList:
+        shopping_cart.add_recipe(link.user_id, link.recipe_id)
+        _bump_cart(link.user_id)
+    return True
+
+
+def remove(model, **fields):
+    """Удаляет связь model(**fields); False, если её не было."""
+    link = _link(model, fields)
+    columns, values = _columns(link, fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {_table(model)} WHERE '
+            + ' AND '.join(f'{column} = %s' for column in columns)
+            + f' RETURNING {_pk(model)}', values)
+        row = cursor.fetchone()
+    if row is None:
+        return False
+    link.pk = row[0]
+    counters.link_removed(link)
+    if model is ShoppingList:
+        # Суммы вычитаются только после того, как DELETE вернул строку:
+        # параллельное повторное удаление строку не получит и корзину
+        # второй раз не уменьшит. remove_recipes не опирается на строку
+        # корзины, которой уже нет.
+        shopping_cart.remove_recipes(link.user_id, [link.recipe_id])
+        _bump_cart(link.user_id)
+    return True
+
+
+def add_many(model, user_id, recipe_ids):
+    """Добавляет рецепты в избранное или корзину user_id.
+
+    Возвращает id добавленных: рецептов, которых нет, и уже добавленных
+    среди них не будет.
+    """
+    if not recipe_ids:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_table(model)} ({_column(model, "user")}, '
+            f'{_column(model, "recipe")}) '
+            f'SELECT CAST(%s AS bigint), {_pk(Recipe)} FROM {_table(Recipe)} '
+            f'WHERE {_pk(Recipe)} IN ({_placeholders(recipe_ids)}) '
+            f'ON CONFLICT DO NOTHING RETURNING {_column(model, "recipe")}',
+            [user_id, *recipe_ids])
+        added = [row[0] for row in cursor.fetchall()]
+    _changed_many(model, user_id, added, 1)
+    return added
+
+
+def remove_many(model, user_id, recipe_ids):
+    """Убирает рецепты из избранного или корзины user_id.
+
+    Возвращает id убранных.
+    """
+    if not recipe_ids:
+        return []
+    removed = _delete_many(
+        model, user_id,
+        f' AND {_column(model, "recipe")} IN ({_placeholders(recipe_ids)})',
+        recipe_ids)
+    _changed_many(model, user_id, removed, -1)
+    return removed
+
+
+def clear(model, user_id):
+    """Убирает все рецепты из избранного или корзины user_id."""
+    removed = _delete_many(model, user_id, '', [])
+    counters.links_removed(
+        [model(user_id=user_id, recipe_id=pk) for pk in removed])
+    if model is ShoppingList and removed:
+        # Суммы корзины пустеют целиком, вычитать составы не нужно.
+        shopping_cart.clear(user_id)
+        _bump_cart(user_id)
+    return removed
+
+
+def _delete_many(model, user_id, condition, params):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {_table(model)} '
+            f'WHERE {_column(model, "user")} = %s{condition} '
+            f'RETURNING {_column(model, "recipe")}',
+            [user_id, *params])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _changed_many(model, user_id, recipe_ids, sign):
+    if not recipe_ids:
+        return
+    links = [model(user_id=user_id, recipe_id=pk) for pk in recipe_ids]
+    if sign > 0:
+        counters.links_added(links)
+    else:
+        counters.links_removed(links)
+    if model is ShoppingList:
+        if sign > 0:
+            shopping_cart.add_recipes(user_id, recipe_ids)
+        else:
+            shopping_cart.remove_recipes(user_id, recipe_ids)
+        _bump_cart(user_id)
+
+
+def _link(model, fields):
+    # id из URL приходят строками.
+    return model(**{
+        name: model._meta.get_field(name).to_python(value)
+        for name, value in fields.items()})
+
+
+def _columns(link, fields):
+    columns = []
+    values = []
+    for name in fields:
+        field = link._meta.get_field(name)
+        columns.append(connection.ops.quote_name(field.column))
+        values.append(field.get_db_prep_value(
+            getattr(link, field.attname), connection))
+    return columns, values
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _column(model, name):
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _pk(model):
+    return connection.ops.quote_name(model._meta.pk.column)
+
+
+def _bump_cart(user_id):
+    transaction.on_commit(lambda: bump_version(item(CARTS, user_id)))
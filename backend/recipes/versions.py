@@ -0,0 +1,98 @@
+"""Версии справочников для сброса кэшей во всех процессах.
+
+При сбросе записывается новое случайное значение. С общим кэшем (Redis,
+VERSIONS_IN_CACHE) версия хранится в нём и её проверка не обращается к
+базе данных. LocMemCache у каждого процесса свой, и сброс из команды
+manage.py не дошёл бы до воркеров gunicorn, поэтому без общего кэша
+версии хранятся в таблице CatalogVersion: одно чтение на запрос.
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CatalogVersion
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+# Версии отдельных объектов: имя строится функцией item.
+RECIPES = 'recipes'
+USERS = 'users'
+CARTS = 'carts'
+
+KEY_PREFIX = 'catalog-version'
+
+
+def get_version(name):
+    """Текущая версия справочника name."""
+    if not settings.VERSIONS_IN_CACHE:
+        return get_versions([name])[name]
+    key = f'{KEY_PREFIX}:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(names):
+    """Версии нескольких имён за одно обращение к кэшу или базе."""
+    if not settings.VERSIONS_IN_CACHE:
+        return _stored_versions(names)
+    keys = {name: f'{KEY_PREFIX}:{name}' for name in names}
+    versions = cache.get_many(keys.values())
+    missing = {
+        key: uuid4().hex for key in keys.values() if key not in versions}
+    if missing:
+        # Гонка с параллельной записью безопасна: любое новое значение
+        # лишь делает старые представления недоступными.
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return {name: versions[key] for name, key in keys.items()}
+
+
+def item(name, pk):
+    """Имя версии одного объекта, например рецепта или пользователя."""
+    return f'{name}:{pk}'
+
+
+def bump_version(name):
+    """Помечает все закэшированные представления справочника устаревшими."""
+    if not settings.VERSIONS_IN_CACHE:
+        _store_versions([name])
+        return
+    cache.set(f'{KEY_PREFIX}:{name}', uuid4().hex, timeout=None)
+
+
+def bump_versions(names):
+    """То же, что bump_version, для нескольких имён за одну запись."""
+    if not settings.VERSIONS_IN_CACHE:
+        _store_versions(names)
+        return
+    cache.set_many(
+        {f'{KEY_PREFIX}:{name}': uuid4().hex for name in names},
+        timeout=None)
+
+
+def _stored_versions(names):
+    names = set(names)
+    versions = dict(CatalogVersion.objects.filter(
+        name__in=names).values_list('name', 'value'))
+    missing = names - versions.keys()
+    if missing:
+        # Параллельный процесс мог создать ту же версию: тогда берётся его.
+        CatalogVersion.objects.bulk_create(
+            (CatalogVersion(name=name, value=uuid4().hex)
+             for name in missing),
+            ignore_conflicts=True)
+        versions.update(CatalogVersion.objects.filter(
+            name__in=missing).values_list('name', 'value'))
+    return versions
+
+
+def _store_versions(names):
+    CatalogVersion.objects.bulk_create(
+        (CatalogVersion(name=name, value=uuid4().hex) for name in set(names)),
+        update_conflicts=True,
+        unique_fields=('name',),
+        update_fields=('value',))
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from recipes import counters
 from .models import User, Subscription
 
 
@@ -12,7 +13,9 @@ class UsersAdmin(UserAdmin):
         'username',
         'email',
         'first_name',
-        'last_name')
+        'last_name',
+        'recipes_count',
+        'followers_count')
 
     list_filter = ('username', 'email')
     search_fields = ('username', 'email')
@@ -29,3 +32,8 @@ class SubscriptionAdmin(admin.ModelAdmin):
     search_fields = ('subscriber__username', 'author__username')
     list_editable = ('subscriber', 'author')
     list_filter = ('subscriber', 'author')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            counters.link_moved(obj, form.initial)
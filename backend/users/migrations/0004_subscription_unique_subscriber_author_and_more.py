@@ -16,6 +16,6 @@ class Migration(migrations.Migration):
         ),
         migrations.AddConstraint(
             model_name='subscription',
-            constraint=models.CheckConstraint(condition=models.Q(('subscriber', models.F('author')), _negated=True), name='check_subscriber_author'),
+            constraint=models.CheckConstraint(check=models.Q(('subscriber', models.F('author')), _negated=True), name='check_subscriber_author'),
         ),
     ]
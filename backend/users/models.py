@@ -5,10 +5,32 @@ from django.db import models
 from .constants import EMAIL_MAX_LENGTH, USERNAME_MAX_LENGTH
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Обычное сохранение строки не переписывает хранимые счётчики.
+
+    Счётчики меняет recipes.counters выражениями F(); save() строки,
+    загруженной до такого изменения, вернул бы в базу старые значения.
+    Поэтому save() без update_fields пишет все поля, кроме COUNTER_FIELDS.
+    """
+
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name', 'password')
+    COUNTER_FIELDS = ('recipes_count', 'followers_count', 'following_count')
 
     username = models.CharField(
         max_length=USERNAME_MAX_LENGTH,
@@ -47,6 +69,29 @@ class User(AbstractUser):
         null=True,
         default=None)
 
+    # Заполняется recipes.renditions.
+    avatar_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии аватарки')
+
+    # Поддерживаются recipes.counters.
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов')
+
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков')
+
+    following_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписок')
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'